@@ -6,9 +6,10 @@ ssiddall Jan 2025
 
 #next steps: TODO 1: identify correct models to use. TODO 2: clean up inputs. TODO 3: select which dates each model should print? TODO 4: select which variables to use from each model?
 
-import requests
 import pandas as pd
 
+from open_meteo_client import OpenMeteoClient
+
 # STEP 1: Get User Input for Location and Models
 latitude = input("Enter latitude (e.g., 48.4284): ").strip()
 longitude = input("Enter longitude (e.g., -123.3656): ").strip()
@@ -52,56 +53,54 @@ api_models = [model_name_mapping[model] for model in selected_models if model in
 
 # STEP 2: Pull down wx data from open meteo. using sample code from open meteo website
 weather_data_frames = []
-
+client = OpenMeteoClient()  # pooled connections + on-disk cache, see open_meteo_client.py
+hourly_variables = [
+    "temperature_2m", "relative_humidity_2m", "dew_point_2m", "precipitation",
+    "cloud_cover", "cloud_cover_low", "cloud_cover_mid", "cloud_cover_high",
+    "visibility", "vapour_pressure_deficit", "wind_speed_10m", "wind_gusts_10m",
+    "soil_temperature_0cm", "soil_temperature_6cm", "soil_temperature_18cm",
+    "soil_temperature_54cm", "soil_moisture_0_to_1cm", "soil_moisture_1_to_3cm",
+    "soil_moisture_3_to_9cm", "soil_moisture_9_to_27cm", "soil_moisture_27_to_81cm"
+]
+
+# every model is requested at the same time, then stitched back together in the order entered
+model_requests = []
 for model in selected_models:
     if model not in available_models:
         print(f"Model '{model}' is not available. Skipping...")
         continue
 
-    api_url = "https://api.open-meteo.com/v1/forecast"
     forecast_days = int(available_models[model].split()[0]) if available_models[model][0].isdigit() else 10
+    model_requests.append((model, forecast_days))
+
+fetched = client.fetch_models(
+    [(model, [(latitude, longitude)], {"forecast_days": forecast_days, "timezone": "America/Los_Angeles"})
+     for model, forecast_days in model_requests],
+    hourly_variables, concurrency=4, retries=3)
+
+for (model, forecast_days), responses in zip(model_requests, fetched):
+    if isinstance(responses, Exception):
+        print(f"Error fetching data for {model}: {responses}")
+        continue
+    weather_data = responses[0]
+
+    # Convert JSON response into a pandas DataFrame
+    hourly_data = weather_data["hourly"]
+    df = pd.DataFrame(hourly_data)
+
+    # Convert timestamps to pandas datetime
+    df["date"] = pd.to_datetime(df["time"])
+    df = df.drop(columns=["time"])  # Drop original time column
+
+    # Add metadata
+    df["model"] = model
+    df["forecast_days"] = forecast_days
+    df["latitude"] = latitude
+    df["longitude"] = longitude
 
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": [
-            "temperature_2m", "relative_humidity_2m", "dew_point_2m", "precipitation",
-            "cloud_cover", "cloud_cover_low", "cloud_cover_mid", "cloud_cover_high",
-            "visibility", "vapour_pressure_deficit", "wind_speed_10m", "wind_gusts_10m",
-            "soil_temperature_0cm", "soil_temperature_6cm", "soil_temperature_18cm",
-            "soil_temperature_54cm", "soil_moisture_0_to_1cm", "soil_moisture_1_to_3cm",
-            "soil_moisture_3_to_9cm", "soil_moisture_9_to_27cm", "soil_moisture_27_to_81cm"
-        ],
-        "models": model,
-        "forecast_days": forecast_days,
-        "timezone": "America/Los_Angeles"
-    }
-
-    try:
-        response = requests.get(api_url, params=params)
-        response.raise_for_status()
-        weather_data = response.json()
-
-        # Convert JSON response into a pandas DataFrame
-        hourly_data = weather_data["hourly"]
-        df = pd.DataFrame(hourly_data)
-
-        # Convert timestamps to pandas datetime
-        df["date"] = pd.to_datetime(df["time"])
-        df = df.drop(columns=["time"])  # Drop original time column
-
-        # Add metadata
-        df["model"] = model
-        df["forecast_days"] = forecast_days
-        df["latitude"] = latitude
-        df["longitude"] = longitude
-
-        # Store the DataFrame
-        weather_data_frames.append(df)
-        print(f"Successfully fetched data for {model} ({forecast_days} days).")
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data for {model}: {e}")
+    # Store the DataFrame
+    weather_data_frames.append(df)
+    print(f"Successfully fetched data for {model} ({forecast_days} days).")
 
 # SSTEP 3: process and format data to transition from model to model
 if weather_data_frames:
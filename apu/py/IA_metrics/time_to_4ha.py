@@ -3,7 +3,12 @@
 ## author: Lochlan Noble
 ## initialization date: 2025.05.09
 ## purpose: Create time to 4ha IA metrics from the SFMS Daily GDB
-## notes: 
+## notes: the GDB is read with pyogrio as arrow record batches: only the requested
+##        fields are read, attribute (where) and bbox filters are done by GDAL, and
+##        features never become python dicts. falls back to fiona if pyogrio is missing.
+##        time to 4 ha: head ROS/HFI from the SFMS ROS/HFI fields where the layer has them, otherwise from the
+##        vectorized FBP in 10_day_indices_v3.2 (compute_full_fbp_array). back ROS and length to breadth from the
+##        ST-X-3 ellipse, all features of a day at once.
 ## outputs: see folder ""
 ## updated: 2025.06.18
 ## To Do:
@@ -13,24 +18,339 @@
 
 
 # Import necessary libraries (& functions in the future)
+import os
+import sys
+import warnings
 import fiona
+from functools import lru_cache
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from itertools import islice
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+
+try:
+    import pyogrio
+    from pyogrio.raw import open_arrow
+except ImportError:
+    pyogrio = None
 
-# current date and time in YYYYMMDDHH format
 # Only use the 1300 hour for time - should this be 1500 or param?
-current_time = datetime.now().strftime("%Y%m%d") + "13"
+SFMS_HOUR = "13"
+SFMS_FOLDER = "//WildfireGeo/Geomatics$/GIS_Data/SFMS_Daily_Shapefiles"
+
+# SFMS field names used by the time to 4ha engine. these are assumed names, not checked against a GDB schema:
+# compare them with _layer_fields(gdb_path, layer) for a real snapshot and adjust here (or pass fields=).
+# fuel, ffmc, bui and wind are required. the rest are optional, and sfms_time_to_4ha warns when one is missing:
+# - ros/hfi: the SFMS head ROS/HFI, used as is where present, computed with the FBP otherwise
+# - isi: worked out from FFMC and wind when missing
+# - slope: flat ground when missing
+# - lat: from the geometry when the table has one, otherwise 0 (only affects foliar moisture)
+SFMS_FIELDS = {"fuel": "FUEL_TYPE", "ffmc": "FFMC", "bui": "BUI", "wind": "WS", "ros": "ROS", "hfi": "HFI",
+               "isi": "ISI", "slope": "SLOPE", "lat": "LAT"}
+SFMS_REQUIRED_FIELDS = ("fuel", "ffmc", "bui", "wind")
+
+# 4 ha in m2
+FOUR_HA = 40000.0
+TEN_DAY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "10_day_indices_v3.2")
+
+
+def sfms_gdb_path(date, hour=SFMS_HOUR):
+    # Path to the .gdb file for a day (date as datetime or YYYYMMDD)
+    if not isinstance(date, str):
+        date = date.strftime("%Y%m%d")
+    return f"{SFMS_FOLDER}/SFMSDaily_{date}{hour}.gdb"
+
+
+def iter_sfms_batches(gdb_path, layer=None, columns=None, where=None, bbox=None, geometry=False, batch_size=65536):
+    """
+    Stream one layer of an SFMS GDB as DataFrames of up to batch_size rows.
+
+    Inputs:
+    - gdb_path: path to the .gdb
+    - layer: layer name or index, None for the first layer
+    - columns: list of fields to read, None for all of them
+    - where: attribute filter handed to GDAL, SQL WHERE syntax (e.g. "HFI > 4000")
+    - bbox: (minx, miny, maxx, maxy) in the layer's CRS, only features intersecting it are read
+    - geometry: Bool value of whether to read the geometry (GeoDataFrame batches), skipped by default
+    - batch_size: rows per batch
+
+    Outputs:
+    - generator of DataFrames (GeoDataFrames if geometry=True)
+    """
+    if pyogrio is None:
+        yield from _iter_fiona_batches(gdb_path, layer, columns, where, bbox, geometry, batch_size)
+        return
+
+    with open_arrow(gdb_path, layer=layer, columns=columns, where=where, bbox=bbox,
+                    read_geometry=geometry, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        for batch in reader:
+            df = batch.to_pandas()
+            if geometry:
+                import geopandas as gpd
+                geometry_name = meta["geometry_name"] or "wkb_geometry"
+                df = gpd.GeoDataFrame(df.drop(columns=[geometry_name]),
+                                      geometry=gpd.GeoSeries.from_wkb(df[geometry_name].values), crs=meta["crs"])
+            yield df
+
+
+def _iter_fiona_batches(gdb_path, layer, columns, where, bbox, geometry, batch_size):
+    # same as iter_sfms_batches without pyogrio: fields are still limited and filters still pushed to GDAL,
+    # records are gathered into columns per batch
+    with fiona.open(gdb_path, layer=layer or 0, include_fields=columns) as src:
+        fields = list(src.schema["properties"]) if columns is None else list(columns)
+        features = src.filter(bbox=bbox, where=where) if (bbox or where) else iter(src)
+        while True:
+            chunk = list(islice(features, batch_size))
+            if not chunk:
+                return
+            df = pd.DataFrame({field: [feature.properties[field] for feature in chunk] for field in fields})
+            if geometry:
+                import geopandas as gpd
+                from shapely.geometry import shape
+                df = gpd.GeoDataFrame(df, geometry=[shape(feature.geometry) for feature in chunk], crs=src.crs)
+            yield df
+
+
+def read_sfms_layer(gdb_path, layer=None, columns=None, where=None, bbox=None, geometry=False, batch_size=65536):
+    """
+    One layer of an SFMS GDB as a single DataFrame, read in batches (see iter_sfms_batches for the inputs).
+    """
+    batches = list(iter_sfms_batches(gdb_path, layer, columns, where, bbox, geometry, batch_size))
+    if not batches:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(batches, ignore_index=True)
+
+
+def read_sfms_gdb(gdb_path, layers=None, columns=None, where=None, bbox=None, geometry=False):
+    """
+    Several (by default all) layers of an SFMS GDB stacked into one DataFrame with a 'layer' column.
+    Fields missing from a layer come back empty.
+
+    Inputs:
+    - gdb_path: path to the .gdb
+    - layers: list of layer names, None for every layer
+    - columns, where, bbox, geometry: as in iter_sfms_batches
+    """
+    if layers is None:
+        layers = fiona.listlayers(gdb_path)
+    frames = []
+    for layer in layers:
+        layer_columns = columns
+        if columns is not None:
+            # only ask a layer for the fields it actually has
+            available = _layer_fields(gdb_path, layer)
+            layer_columns = [c for c in columns if c in available]
+        df = read_sfms_layer(gdb_path, layer, layer_columns, where, bbox, geometry)
+        df["layer"] = layer
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    stacked = pd.concat(frames, ignore_index=True)
+    return stacked[[c for c in stacked.columns if c != "layer"] + ["layer"]]
+
+
+def _layer_fields(gdb_path, layer):
+    if pyogrio is not None:
+        return set(pyogrio.read_info(gdb_path, layer=layer)["fields"])
+    with fiona.open(gdb_path, layer=layer) as src:
+        return set(src.schema["properties"])
+
+
+def read_sfms_days(start_date, end_date, hour=SFMS_HOUR, layers=None, columns=None, where=None, bbox=None,
+                   geometry=False):
+    """
+    SFMS daily GDBs for every day from start_date to end_date (inclusive) stacked into one DataFrame with a
+    'date' column. Days without a GDB are skipped with a message.
+
+    Inputs:
+    - start_date, end_date: datetimes
+    - hour: snapshot hour in the file name
+    - layers: list of layer names, None for the first layer only, "all" for every layer
+    - columns, where, bbox, geometry: as in iter_sfms_batches
+    """
+    frames = []
+    day = start_date
+    while day <= end_date:
+        gdb_path = sfms_gdb_path(day, hour)
+        if not os.path.exists(gdb_path):
+            print(f"No SFMS GDB for {day:%Y-%m-%d}: {gdb_path}")
+        elif layers is None:
+            frames.append(read_sfms_layer(gdb_path, None, columns, where, bbox, geometry).assign(date=day))
+        else:
+            frames.append(read_sfms_gdb(gdb_path, None if layers == "all" else layers,
+                                        columns, where, bbox, geometry).assign(date=day))
+        day += timedelta(days=1)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+@lru_cache(maxsize=None)
+def fbp_module():
+    # 10_day_indices_v3.2 loaded as a module (no .py extension), so the ROS/HFI here is the same code as the forecast
+    repo_root = os.path.dirname(os.path.abspath(TEN_DAY_SCRIPT))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    loader = SourceFileLoader("ten_day_indices", TEN_DAY_SCRIPT)
+    module = module_from_spec(spec_from_loader(loader.name, loader))
+    sys.modules[loader.name] = module
+    loader.exec_module(module)
+    return module
+
+
+def length_to_breadth(fuel_types, wind):
+    # ST-X-3 length to breadth ratio of the fire ellipse, grass has its own curve
+    wind = np.asarray(wind, dtype=float)
+    grass = np.char.startswith(np.char.upper(np.asarray(fuel_types, dtype=str)), "O1")
+    with np.errstate(invalid="ignore"):
+        lb = np.where(grass, np.where(wind < 1.0, 1.0, 1.1 * np.maximum(wind, 1.0)**0.464),
+                      1.0 + 8.729 * (1.0 - np.exp(-0.030 * wind))**2.155)
+    return lb
+
+
+def time_to_4ha(fuel_types, ffmc, bui, wind, isi=None, slope=0.0, lat=0.0, elev=0.0, day_of_year=180,
+                ros=None, hfi=None):
+    """
+    Minutes until a point ignition grows to 4 ha, for every feature at once.
+    The fire is an ellipse with head ROS from compute_full_fbp_array (10_day_indices_v3.2) or given (SFMS ROS),
+    back ROS from the back fire ISI (wind function reversed, flat ground) and the ST-X-3 length to breadth ratio
+    for the wind speed. Area after t minutes is pi/4 * ((ROS + BROS) * t)^2 / LB, solved for 4 ha.
+
+    Inputs:
+    - fuel_types: FBP fuel codes per feature (C2, M1, O1a...), unknown codes use the forecast's fallback ROS
+    - ffmc, bui: codes per feature
+    - wind: 10 m wind speed (km/h) per feature
+    - isi: ISI per feature, None to compute it from ffmc and wind
+    - slope: percent slope, lat/elev/day_of_year: passed to the FBP (foliar moisture)
+    - ros, hfi: head ROS (m/min) and HFI (kW/m) per feature to use instead of the FBP ones, None to compute them.
+      NaN entries are computed
+
+    Outputs:
+    - DataFrame with ros, bros, hfi, lb and minutes (inf where the fire doesn't spread)
+    """
+    fbp = fbp_module()
+    fuel_types = np.asarray(fuel_types, dtype=str)
+    ffmc = np.asarray(ffmc, dtype=float)
+    bui = np.asarray(bui, dtype=float)
+    wind = np.asarray(wind, dtype=float)
+    if isi is None:
+        isi = fbp.isi_array(ffmc, wind)
+    isi = np.asarray(isi, dtype=float)
+
+    fuel_id = fbp.fuel_ids(fuel_types)
+    fbp_ros, fbp_hfi = fbp.compute_full_fbp_array(fuel_id, ffmc, isi, bui, wind, slope, lat, elev, day_of_year)
+    ros = fbp_ros if ros is None else np.where(np.isnan(ros), fbp_ros, np.asarray(ros, dtype=float))
+    hfi = fbp_hfi if hfi is None else np.where(np.isnan(hfi), fbp_hfi, np.asarray(hfi, dtype=float))
+    # back fire: same fuel model with the wind blowing the other way, no slope boost
+    bros, _ = fbp.compute_full_fbp_array(fuel_id, ffmc, fbp.isi_array(ffmc, -wind), bui, wind, 0.0, lat, elev,
+                                         day_of_year)
+    lb = length_to_breadth(fuel_types, wind)
+
+    spread = ros + bros
+    with np.errstate(divide="ignore", invalid="ignore"):
+        minutes = np.where(spread > 0, np.sqrt(4.0 * FOUR_HA * lb / np.pi) / spread, np.inf)
+    return pd.DataFrame({"ros": ros, "bros": bros, "hfi": hfi, "lb": lb, "minutes": minutes})
+
+
+def sfms_time_to_4ha(sfms, fields=SFMS_FIELDS, day_of_year=None):
+    """
+    time_to_4ha for an SFMS table (one row per cell or fire), the results are added as columns.
+    A missing required field raises KeyError, a missing optional one is warned about with the fallback used.
+
+    Inputs:
+    - sfms: DataFrame/GeoDataFrame from read_sfms_layer etc.
+    - fields: SFMS field names for fuel, ffmc, bui, wind and the optional ros, hfi, isi, slope, lat (see SFMS_FIELDS)
+    - day_of_year: day for the FBP, defaults to the 'date' column (read_sfms_days) or today
+    """
+    missing = [f"{key} ({fields.get(key)})" for key in SFMS_REQUIRED_FIELDS if fields.get(key) not in sfms]
+    if missing:
+        raise KeyError(f"SFMS table is missing field(s) {', '.join(missing)}, it has: {', '.join(map(str, sfms.columns))}. "
+                       f"Set the names in SFMS_FIELDS or fields=.")
+    if day_of_year is None:
+        day = sfms["date"].iloc[0] if "date" in sfms and len(sfms) else datetime.now()
+        day_of_year = day.timetuple().tm_yday
+
+    def optional(key, default, fallback):
+        name = fields.get(key)
+        if name in sfms:
+            return sfms[name].to_numpy(dtype=float)
+        warnings.warn(f"SFMS field {name} ({key}) not in the table, {fallback}.", stacklevel=3)
+        return default
+
+    lat_fallback = "latitude 0 used for foliar moisture"
+    geometry = getattr(sfms, "geometry", None) if fields.get("lat") not in sfms else None
+    if geometry is not None and sfms.crs is not None and len(sfms):
+        lat_fallback = "latitude taken from the geometry"
+        lat_default = geometry.representative_point().to_crs(epsg=4326).y.to_numpy()
+    else:
+        lat_default = 0.0
+
+    result = time_to_4ha(sfms[fields["fuel"]].fillna("").to_numpy(dtype=str),
+                         sfms[fields["ffmc"]].to_numpy(dtype=float),
+                         sfms[fields["bui"]].to_numpy(dtype=float),
+                         sfms[fields["wind"]].to_numpy(dtype=float),
+                         isi=optional("isi", None, "ISI computed from FFMC and wind"),
+                         slope=optional("slope", 0.0, "flat ground assumed"),
+                         lat=optional("lat", lat_default, lat_fallback),
+                         day_of_year=day_of_year,
+                         ros=optional("ros", None, "head ROS computed with the FBP"),
+                         hfi=optional("hfi", None, "HFI computed with the FBP"))
+    out = sfms.copy()
+    for column in result.columns:
+        out[column] = result[column].to_numpy()
+    return out
+
+
+def write_time_to_4ha(results, out_path):
+    # table of results, .parquet or .csv by extension (geometry is dropped from the csv, kept as geoparquet)
+    if out_path.endswith(".parquet"):
+        results.to_parquet(out_path, index=False)
+    else:
+        pd.DataFrame(results.drop(columns="geometry", errors="ignore")).to_csv(out_path, index=False)
+
+
+def time_to_4ha_raster(results, out_path, pixel_size=2000, column="minutes", nodata=-1.0):
+    """
+    Burn a result column of a GeoDataFrame (cells as polygons or points) into a float32 GeoTIFF.
+    Features that never reach 4 ha are written as nodata.
+
+    Inputs:
+    - results: GeoDataFrame from sfms_time_to_4ha with geometry=True
+    - out_path: .tif to write
+    - pixel_size: in CRS units
+    """
+    import rasterio
+    from rasterio.features import rasterize
+    from rasterio.transform import from_origin
+
+    minx, miny, maxx, maxy = results.total_bounds
+    width = max(int(np.ceil((maxx - minx) / pixel_size)), 1)
+    height = max(int(np.ceil((maxy - miny) / pixel_size)), 1)
+    transform = from_origin(minx, maxy, pixel_size, pixel_size)
+    values = results[column].to_numpy(dtype=float)
+    values = np.where(np.isfinite(values), values, nodata)
+    raster = rasterize(zip(results.geometry, values), out_shape=(height, width), transform=transform,
+                       fill=nodata, dtype="float32")
+    with rasterio.open(out_path, "w", driver="GTiff", height=height, width=width, count=1, dtype="float32",
+                       crs=results.crs, transform=transform, nodata=nodata, compress="deflate") as dst:
+        dst.write(raster, 1)
+
 
-# Path to the .gdb file
-gdb_path = "//WildfireGeo/Geomatics$/GIS_Data/SFMS_Daily_Shapefiles/SFMSDaily_" + current_time + ".gdb"
+if __name__ == "__main__":
+    # current date and time in YYYYMMDDHH format
+    today = datetime.now()
+    gdb_path = sfms_gdb_path(today)
 
-# List all layers in the .gdb file
-layers = fiona.listlayers(gdb_path)
-print("Layers:", layers)
+    # List all layers in the .gdb file
+    layers = fiona.listlayers(gdb_path)
+    print("Layers:", layers)
 
-# Example: Read the first layer into a pandas DataFrame
-with fiona.open(gdb_path, layer=layers[0]) as src:
-    records = [feature['properties'] for feature in src]
-    df = pd.DataFrame(records)
+    # time to 4ha for every feature of the first layer, only the fields the engine needs are read
+    available = _layer_fields(gdb_path, layers[0])
+    columns = [name for name in SFMS_FIELDS.values() if name in available]
+    df = read_sfms_layer(gdb_path, layers[0], columns=columns, geometry=True)
+    results = sfms_time_to_4ha(df, day_of_year=today.timetuple().tm_yday)
+    write_time_to_4ha(results, f"time_to_4ha_{today:%Y%m%d}{SFMS_HOUR}.csv")
+    time_to_4ha_raster(results, f"time_to_4ha_{today:%Y%m%d}{SFMS_HOUR}.tif")
 
-print(df.head())
\ No newline at end of file
+    print(results[["ros", "bros", "hfi", "minutes"]].describe())
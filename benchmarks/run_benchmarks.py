@@ -0,0 +1,442 @@
+'''
+Benchmarks for the hot paths: FWI/FBP (scalar, array, lookup cube, ensemble), perimeter scoring, rasterization +
+confusion, hotspot queries and the SFMS GDB read / time to 4ha path.
+
+Every input is generated from a fixed seed (weather, fire perimeters, hotspot clouds, an SFMS style GDB), so runs
+are comparable between releases. Each benchmark runs in its own fresh process: inputs are built first (not timed),
+then the call is timed `repeat` times and run once more under tracemalloc for the peak memory it allocates.
+
+Results go to a JSON file: per benchmark the best/median seconds, throughput (items per second), peak traced memory
+(Python + numpy allocations during the call) and the process' peak RSS (includes imports and inputs, Linux/mac only).
+Compare against an earlier file to catch regressions.
+
+Dependencies: Numpy, Pandas, Geopandas, Shapely, Rasterio, Fiona, Pyogrio (the repo's own dependencies)
+Sample use (from the repo root):
+>>python3 benchmarks/run_benchmarks.py
+>>python3 benchmarks/run_benchmarks.py --quick --only fwi_fbp_array scoring_compute_areas
+>>python3 benchmarks/run_benchmarks.py --compare benchmarks/results/2025-06-01_120000.json
+'''
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from multiprocessing import get_context
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+SEED = 2023
+# slower than this (ratio of best times) is reported as a regression by --compare
+REGRESSION_RATIO = 1.2
+
+
+def ten_day_module():
+    # 10_day_indices_v3.2 has no .py extension, load it by path
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    loader = SourceFileLoader("ten_day_indices", os.path.join(REPO_ROOT, "10_day_indices_v3.2"))
+    module = module_from_spec(spec_from_loader(loader.name, loader))
+    sys.modules[loader.name] = module
+    loader.exec_module(module)
+    return module
+
+
+def import_from(folder, name):
+    path = os.path.join(REPO_ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(name)
+
+
+#synthetic inputs
+
+def synthetic_weather(rng, shape):
+    # noon weather for a BC summer: warm, dry afternoons, a few rain days
+    return {
+        "Temperature": rng.normal(24.0, 5.0, shape),
+        "RH": np.clip(rng.normal(35.0, 12.0, shape), 5.0, 100.0),
+        "Wind": np.abs(rng.normal(12.0, 6.0, shape)),
+        "Precip": np.where(rng.random(shape) < 0.15, rng.gamma(1.5, 4.0, shape), 0.0)
+    }
+
+
+def synthetic_fire(rng, center, radius, n_parts, n_vertices):
+    # multipolygon of ragged, star shaped parts (spot fires around a main body), EPSG:3005 metres
+    from shapely.geometry import MultiPolygon, Polygon
+    parts = []
+    for p in range(n_parts):
+        r = radius if p == 0 else radius * rng.uniform(0.05, 0.2)
+        offset = (0.0, 0.0) if p == 0 else rng.uniform(-1.5, 1.5, 2) * radius
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+        wiggle = 1 + 0.25 * np.sin(7 * angles + rng.uniform(0, 6)) + 0.08 * rng.standard_normal(n_vertices)
+        x = center[0] + offset[0] + r * wiggle * np.cos(angles)
+        y = center[1] + offset[1] + r * wiggle * np.sin(angles)
+        parts.append(Polygon(np.column_stack([x, y])).buffer(0))
+    geoms = []
+    for part in parts:
+        geoms.extend(getattr(part, "geoms", [part]))
+    return MultiPolygon(geoms)
+
+
+def synthetic_fire_pair(rng, radius=5000.0, n_parts=20, n_vertices=2000):
+    # observed fire and a simulation of it that is a bit bigger and shifted downwind
+    center = (1_400_000.0, 600_000.0)
+    observed = synthetic_fire(rng, center, radius, n_parts, n_vertices)
+    predicted = synthetic_fire(rng, (center[0] + 0.2 * radius, center[1] + 0.1 * radius), 1.15 * radius,
+                               n_parts, n_vertices)
+    return observed, predicted
+
+
+def synthetic_hotspots(rng, n):
+    # VIIRS-like cloud: clustered around a few hundred fires over the province, one season of timestamps
+    n_fires = 300
+    centers = np.column_stack([rng.uniform(400_000, 1_800_000, n_fires), rng.uniform(400_000, 1_700_000, n_fires)])
+    which = rng.integers(0, n_fires, n)
+    xy = centers[which] + rng.normal(0, 3000, (n, 2))
+    start = np.datetime64("2023-05-01T00:00", "s").astype(np.int64)
+    times = start + rng.integers(0, 150 * 86400, n)
+    return xy[:, 0], xy[:, 1], times, centers
+
+
+#benchmarks. each one builds its inputs and returns (call, items, unit, params); only call() is timed
+
+def bench_fwi_fbp_scalar(quick):
+    m = ten_day_module()
+    n_points, n_days = (100, 10) if quick else (1000, 10)
+    rng = np.random.default_rng(SEED)
+    wx = synthetic_weather(rng, (n_days, n_points))
+    fuels = rng.choice(m.FUEL_TYPES, n_points)
+
+    def call():
+        for p in range(n_points):
+            ffmc_val, dmc_val, dc_val = 85.0, 20.0, 200.0
+            for d in range(n_days):
+                ffmc_val, dmc_val, dc_val, isi, bui, _ = m.compute_daily_fwi(
+                    ffmc_val, dmc_val, dc_val, wx["Temperature"][d, p], wx["RH"][d, p],
+                    wx["Wind"][d, p], wx["Precip"][d, p], 180 + d)
+                m.compute_full_fbp(fuels[p], ffmc_val, isi, bui, wx["Wind"][d, p], 10.0, 50.0, 500.0, 180 + d)
+    return call, n_points * n_days, "point-days", {"points": n_points, "days": n_days}
+
+
+def bench_fwi_fbp_array(quick):
+    m = ten_day_module()
+    n_points, n_days = (20_000, 10) if quick else (200_000, 10)
+    rng = np.random.default_rng(SEED)
+    wx = synthetic_weather(rng, (n_days, n_points))
+    fuel = m.fuel_ids(rng.choice(m.FUEL_TYPES, n_points))
+    slope = rng.uniform(0, 60, n_points)
+
+    def call():
+        ffmc_val, dmc_val, dc_val = np.full(n_points, 85.0), np.full(n_points, 20.0), np.full(n_points, 200.0)
+        for d in range(n_days):
+            ffmc_val, dmc_val, dc_val, isi, bui, _ = m.compute_daily_fwi_array(
+                ffmc_val, dmc_val, dc_val, wx["Temperature"][d], wx["RH"][d], wx["Wind"][d], wx["Precip"][d], 180 + d)
+            m.compute_full_fbp_array(fuel, ffmc_val, isi, bui, wx["Wind"][d], slope, 50.0, 500.0, 180 + d)
+    return call, n_points * n_days, "point-days", {"points": n_points, "days": n_days}
+
+
+def bench_fbp_cube_query(quick):
+    m = ten_day_module()
+    n = 200_000 if quick else 2_000_000
+    # coarser than the default cube so the (untimed) build stays short, the query cost doesn't depend on it
+    axes = {"isi": (0.0, 0.5, 201), "bui": (0.0, 4.0, 76), "slope": (0.0, 25.0, 5)}
+    cube = m.FBPCube.build(axes=axes)
+    rng = np.random.default_rng(SEED)
+    fuel = m.fuel_ids(rng.choice(m.FUEL_TYPES, n))
+    ffmc, isi, bui, slope = rng.uniform(75, 96, n), rng.gamma(2.0, 4.0, n), rng.uniform(10, 200, n), rng.uniform(0, 60, n)
+
+    def call():
+        cube.query(fuel, ffmc, isi, bui, 10.0, slope, 50.0, 500.0, 200)
+    return call, n, "queries", {"queries": n, "axes": axes}
+
+
+def bench_ensemble_fwi_fbp(quick):
+    m = ten_day_module()
+    n_members, n_points, n_days = (31, 50, 10) if quick else (51, 500, 10)
+    rng = np.random.default_rng(SEED)
+    weather = synthetic_weather(rng, (n_members, n_points, n_days))
+    start = [np.full(n_points, v) for v in (85.0, 20.0, 200.0)]
+    doy = np.arange(180, 180 + n_days)
+
+    def call():
+        result = m.ensemble_fwi_fbp(weather, *start, doy, ["C2", "C3", "M2", "O1A"], 10.0, 50.0, 500.0)
+        m.percentile_bands(result["HFI"], axis=1)
+    return call, n_members * n_points * n_days, "member-point-days", \
+        {"members": n_members, "points": n_points, "days": n_days, "fuels": 4}
+
+
+def bench_scoring_compute_areas(quick):
+    compare = import_from(os.path.join("model_comparison", "py"), "compare")
+    rng = np.random.default_rng(SEED)
+    n_parts, n_vertices = (10, 500) if quick else (30, 2000)
+    observed, predicted = synthetic_fire_pair(rng, n_parts=n_parts, n_vertices=n_vertices)
+    repeats = 5
+
+    def call():
+        # the batch scoring path: one overlay per comparison, scores from its areas
+        for _ in range(repeats):
+            compare.skill_scores_from_areas(*compare.compute_areas(observed, predicted))
+    return call, repeats, "comparisons", {"parts": n_parts, "vertices_per_part": n_vertices}
+
+
+def write_fire_shapefiles(folder, quick):
+    import geopandas as gpd
+    rng = np.random.default_rng(SEED)
+    observed, predicted = synthetic_fire_pair(rng, n_parts=10 if quick else 30, n_vertices=500 if quick else 2000)
+    paths = []
+    for name, geom in (("simulated", predicted), ("observed", observed)):
+        path = os.path.join(folder, f"{name}.shp")
+        gpd.GeoDataFrame({"id": [1]}, geometry=[geom], crs="EPSG:3005").to_file(path)
+        paths.append(path)
+    return paths
+
+
+def make_confusion_bench(pixel_size):
+    def bench(quick):
+        shape_convert = import_from(os.path.join("model_comparison", "py"), "shape_convert")
+        folder = tempfile.mkdtemp(prefix="bench_shapes_")
+        shape_files = write_fire_shapefiles(folder, quick)
+        transform, width, height = shape_convert.shared_grid(shape_convert.load_shapes(shape_files), pixel_size)
+
+        def call():
+            shape_convert.shapefile_to_raster(shape_files, pixel_size=pixel_size, dtype="uint8")
+            with contextlib.redirect_stdout(io.StringIO()):
+                shape_convert.confusion(shape_files, pixel_size=pixel_size, plot=False)
+        return call, width * height, "pixels", {"pixel_size": pixel_size, "width": width, "height": height}
+    return bench
+
+
+def bench_hotspot_queries(quick):
+    hotspots = import_from(os.path.join("model_comparison", "py"), "hotspots")
+    n_points, n_queries = (200_000, 1000) if quick else (2_000_000, 10_000)
+    rng = np.random.default_rng(SEED)
+    x, y, times, centers = synthetic_hotspots(rng, n_points)
+    store = hotspots.HotspotStore(x, y, times)
+    picks = centers[rng.integers(0, len(centers), n_queries)]
+    days = rng.integers(0, 150, n_queries)
+
+    def call():
+        for (cx, cy), day in zip(picks, days):
+            start = np.datetime64("2023-05-01") + np.timedelta64(int(day), "D")
+            store.query((cx - 10_000, cy - 10_000, cx + 10_000, cy + 10_000), start, start + np.timedelta64(2, "D"))
+    return call, n_queries, "queries", {"hotspots": n_points, "queries": n_queries}
+
+
+def write_sfms_gdb(folder, n):
+    # SFMS style daily GDB: one point layer with the fields time_to_4ha reads plus the rest of a typical layer
+    import geopandas as gpd
+    time_to_4ha = import_from(os.path.join("apu", "py", "IA_metrics"), "time_to_4ha")
+    m = time_to_4ha.fbp_module()
+    rng = np.random.default_rng(SEED)
+    fields = time_to_4ha.SFMS_FIELDS
+    data = {
+        fields["fuel"]: rng.choice(m.FUEL_TYPES, n),
+        fields["ffmc"]: rng.uniform(75, 96, n),
+        fields["bui"]: rng.uniform(10, 200, n),
+        fields["wind"]: np.abs(rng.normal(12, 6, n)),
+        fields["slope"]: rng.uniform(0, 60, n)
+    }
+    for k in range(20):
+        data[f"EXTRA_{k:02d}"] = rng.random(n)
+    gdf = gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(rng.uniform(400_000, 1_800_000, n),
+                                                             rng.uniform(400_000, 1_700_000, n)), crs="EPSG:3005")
+    path = os.path.join(folder, "SFMSDaily_2023081513.gdb")
+    gdf.to_file(path, driver="OpenFileGDB", layer="sfms", engine="pyogrio")
+    return path
+
+
+def make_sfms_bench(reader):
+    def bench(quick):
+        time_to_4ha = import_from(os.path.join("apu", "py", "IA_metrics"), "time_to_4ha")
+        n = 50_000 if quick else 500_000
+        gdb_path = write_sfms_gdb(tempfile.mkdtemp(prefix="bench_sfms_"), n)
+        # the synthetic layer has no ISI/LAT/ROS/HFI, so this times the FBP path (fallback warnings silenced)
+        columns = [name for key, name in time_to_4ha.SFMS_FIELDS.items() if key not in ("isi", "lat", "ros", "hfi")]
+        where = f"{time_to_4ha.SFMS_FIELDS['ffmc']} > 80"
+
+        def call():
+            if reader == "fiona":
+                df = pd_concat(time_to_4ha._iter_fiona_batches(gdb_path, "sfms", columns, where, None, False, 65536))
+            else:
+                df = time_to_4ha.read_sfms_layer(gdb_path, "sfms", columns=columns, where=where)
+            if reader == "time_to_4ha":
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UserWarning)
+                    time_to_4ha.sfms_time_to_4ha(df, day_of_year=227)
+        return call, n, "features", {"features": n, "reader": reader, "columns": len(columns)}
+    return bench
+
+
+def pd_concat(frames):
+    import pandas as pd
+    return pd.concat(list(frames), ignore_index=True)
+
+
+BENCHMARKS = {
+    "fwi_fbp_scalar": bench_fwi_fbp_scalar,
+    "fwi_fbp_array": bench_fwi_fbp_array,
+    "fbp_cube_query": bench_fbp_cube_query,
+    "ensemble_fwi_fbp": bench_ensemble_fwi_fbp,
+    "scoring_compute_areas": bench_scoring_compute_areas,
+    "confusion_50m": make_confusion_bench(50),
+    "confusion_20m": make_confusion_bench(20),
+    "confusion_10m": make_confusion_bench(10),
+    "hotspot_queries": bench_hotspot_queries,
+    "sfms_read_pyogrio": make_sfms_bench("pyogrio"),
+    "sfms_read_fiona": make_sfms_bench("fiona"),
+    # pyogrio read + the time to 4ha model on every feature read
+    "sfms_time_to_4ha": make_sfms_bench("time_to_4ha")
+}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KiB, mac bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(name, quick=False, repeat=3):
+    """
+    Run one benchmark in this process.
+
+    Outputs:
+    - result dict (name, params, items, unit, best_s, median_s, throughput, peak_traced_mb, peak_rss_mb)
+      or with an 'error' entry when the benchmark couldn't run
+    """
+    try:
+        call, items, unit, params = BENCHMARKS[name](quick)
+        call()  # warm up (imports, caches, first touch of memory maps)
+        times = []
+        for _ in range(repeat):
+            gc.collect()
+            t0 = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - t0)
+        gc.collect()
+        tracemalloc.start()
+        call()
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    except Exception as e:
+        return {"name": name, "error": f"{type(e).__name__}: {e}"}
+    best = min(times)
+    return {
+        "name": name,
+        "params": params,
+        "items": items,
+        "unit": unit,
+        "best_s": best,
+        "median_s": statistics.median(times),
+        "throughput": items / best if best > 0 else None,
+        "peak_traced_mb": peak_traced / 1024**2,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def run_isolated(name, quick, repeat):
+    # fresh interpreter per benchmark, so peak RSS and warm caches don't leak between benchmarks
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_benchmark, name, quick, repeat).result()
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+
+def compare_results(results, previous_path, ratio=REGRESSION_RATIO):
+    """
+    Print how each benchmark's best time changed against an earlier results file.
+
+    Outputs:
+    - names of benchmarks that got slower by more than ratio
+    """
+    with open(previous_path) as f:
+        previous = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\nAgainst {previous_path}:")
+    for r in results:
+        old = previous.get(r["name"])
+        if not old or "best_s" not in old or "best_s" not in r:
+            continue
+        change = r["best_s"] / old["best_s"]
+        flag = "  <-- slower" if change > ratio else ""
+        print(f"  {r['name']:<24} {old['best_s']:9.4f}s -> {r['best_s']:9.4f}s  x{change:5.2f}{flag}")
+        if change > ratio:
+            regressions.append(r["name"])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the FWI/FBP, scoring, rasterization and ingest paths.")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="small inputs, for a smoke test")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the best is reported")
+    parser.add_argument("--out", help="results JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run everything in this process (faster, but peak RSS is shared between benchmarks)")
+    args = parser.parse_args(argv)
+
+    names = args.only or list(BENCHMARKS)
+    results = []
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        result = (run_benchmark if args.in_process else run_isolated)(name, args.quick, args.repeat)
+        results.append(result)
+        if "error" in result:
+            print(f"  ERROR: {result['error']}")
+        else:
+            print(f"  best {result['best_s']:.4f}s, {result['throughput']:,.0f} {result['unit']}/s, "
+                  f"peak traced {result['peak_traced_mb']:.1f} MB")
+
+    out_path = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y-%m-%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump({"environment": environment(), "quick": args.quick, "repeat": args.repeat, "results": results},
+                  f, indent=2)
+    print(f"\nResults saved to: {out_path}")
+
+    failed = [r["name"] for r in results if "error" in r]
+    regressions = compare_results(results, args.compare) if args.compare else []
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
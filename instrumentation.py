@@ -0,0 +1,358 @@
+'''
+Stage timing and resource recorder shared by 10_day_indices_v3.2, open_meteo_client.py and model_comparison/py/compare.py
+
+A run is split into stages (fetch, aggregate, fwi, fbp, write, load_*, overlay, ...). Every stage records:
+- wall and CPU seconds (CPU is the whole process, so threads doing HTTP count towards it)
+- peak RSS of the process when the stage ended, and how much the stage raised it
+- rows/features it handled
+- HTTP requests, bytes, seconds waiting on the server, and cache hits/misses, counted by open_meteo_client
+  while the stage is open
+
+Stages nest. A stage opened inside another gets the path outer/inner, and counts go to every open stage, so "fetch"
+carries the HTTP of everything under it. A finished stage is one JSON line (appended to the metrics file), and is
+added to running totals: summary() prints them, and the Prometheus endpoint serves them as text format.
+
+Nothing is written unless it's switched on, with configure() or the WPS_METRICS environment variable (path of the
+JSON lines file). configure() also sets the variable, so worker processes append to the same file (pid in each line).
+
+Process pools: start the workers with initializer=instrumentation.reset_worker, initargs=(instrumentation.current_path(),)
+so they start clean (a forked worker would otherwise inherit the parent's open stages) and their stages nest under the
+stage the pool was started in. Return instrumentation.take_totals() with each task's result and hand it to
+instrumentation.merge() in the parent, so summary() and the Prometheus endpoint include the work done in the workers.
+
+Sample use:
+    import instrumentation
+    instrumentation.configure("metrics.jsonl", port=9108)   # http://localhost:9108/metrics
+    with instrumentation.stage("load") as stage:
+        gdf = gpd.read_file(path)
+        stage.rows = len(gdf)
+    instrumentation.count(http_requests=1, http_bytes=len(body))
+    print(instrumentation.summary())
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+METRICS_PATH_ENV = "WPS_METRICS"
+METRICS_RUN_ENV = "WPS_METRICS_RUN"
+COUNTERS = ("rows", "http_requests", "http_bytes", "http_seconds", "cache_hits", "cache_misses")
+
+
+def peak_rss_mb():
+    # peak resident memory of this process so far, None where getrusage isn't available
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KiB, mac bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class Stage:
+    """
+    One timed stage. Use it as a context manager, or start()/stop() it where a with block won't fit.
+
+    Parameters:
+    - recorder: StageRecorder the stage reports to
+    - name: stage name
+    - rows: rows/features handled, can be set or added to while the stage runs
+    """
+
+    def __init__(self, recorder, name, rows=0):
+        self.recorder = recorder
+        self.name = name
+        self.path = name
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.counts["rows"] = rows
+        self._started = None
+
+    @property
+    def rows(self):
+        return self.counts["rows"]
+
+    @rows.setter
+    def rows(self, value):
+        self.counts["rows"] = value
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def start(self):
+        self.recorder._push(self)
+        self._rss = peak_rss_mb()
+        self._cpu = time.process_time()
+        self._started = time.perf_counter()
+        return self
+
+    def stop(self, error=None):
+        if self._started is None:
+            return None
+        wall = time.perf_counter() - self._started
+        cpu = time.process_time() - self._cpu
+        self._started = None
+        self.recorder._pop(self)
+        rss = peak_rss_mb()
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "run": self.recorder.run,
+            "pid": os.getpid(),
+            "stage": self.path,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_mb": rss,
+            "rss_growth_mb": None if rss is None else rss - self._rss,
+            **self.counts
+        }
+        lookups = self.counts["cache_hits"] + self.counts["cache_misses"]
+        record["cache_hit_rate"] = self.counts["cache_hits"] / lookups if lookups else None
+        if error:
+            record["error"] = error
+        self.recorder._finish(record)
+        return record
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop(exc_type.__name__ if exc_type else None)
+        return False
+
+
+class StageRecorder:
+    """
+    Collects finished stages: JSON lines to a file, running totals for summary() and the Prometheus endpoint.
+
+    Parameters:
+    - path: JSON lines file appended to, None to only keep totals
+    - run: id written in every line, so several processes of one run can be told apart from other runs
+    """
+
+    def __init__(self, path=None, run=None):
+        self.path = path
+        self.run = run or datetime.now().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        self.totals = {}
+        self.server = None
+        self.prefix = None
+        self._open = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def reset(self, prefix=None):
+        # fresh state for a worker process: nothing open, no totals, its own file handle and lock.
+        # prefix: path the worker's stages nest under (the parent's open stage when the pool started)
+        self.prefix = prefix
+        self.totals = {}
+        self.server = None
+        self._open = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def current_path(self):
+        # path of the innermost open stage, what a stage started now would nest under
+        with self._lock:
+            return self._open[-1].path if self._open else self.prefix
+
+    def take_totals(self):
+        # totals since the last call (cleared), for a worker to send back with its result
+        with self._lock:
+            totals, self.totals = self.totals, {}
+        return totals
+
+    def merge(self, totals):
+        # add totals from another process (take_totals) to this one's, their JSON lines are already written
+        with self._lock:
+            for path, values in totals.items():
+                mine = self.totals.setdefault(path, dict.fromkeys(values, 0))
+                for key, value in values.items():
+                    mine[key] = mine.get(key, 0) + value
+
+    def stage(self, name, rows=0):
+        return Stage(self, name, rows)
+
+    def start(self, name, rows=0):
+        return Stage(self, name, rows).start()
+
+    def timed(self, name, rows=None):
+        """
+        Decorator running every call of a function as a stage.
+        rows: function of the return value giving the rows handled (e.g. len), None to leave it at 0
+        """
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as stage:
+                    result = func(*args, **kwargs)
+                    if rows is not None:
+                        stage.rows = rows(result)
+                    return result
+            return wrapper
+        return decorate
+
+    def count(self, **counts):
+        # add to every open stage (HTTP counted from worker threads lands in the stage that started them)
+        with self._lock:
+            for stage in self._open:
+                stage.add(**counts)
+
+    def _push(self, stage):
+        with self._lock:
+            parent = self._open[-1].path if self._open else self.prefix
+            if parent:
+                stage.path = f"{parent}/{stage.name}"
+            self._open.append(stage)
+
+    def _pop(self, stage):
+        # stages started inside this one and never stopped (an exception went past their stop()) go with it
+        with self._lock:
+            if stage in self._open:
+                del self._open[self._open.index(stage):]
+
+    def _finish(self, record):
+        with self._lock:
+            totals = self.totals.setdefault(record["stage"], dict.fromkeys(("calls", "wall_s", "cpu_s") + COUNTERS, 0))
+            totals["calls"] += 1
+            for key in ("wall_s", "cpu_s") + COUNTERS:
+                totals[key] += record.get(key, 0)
+            if self.path:
+                if self._file is None or self._file.name != self.path:
+                    self._file = open(self.path, "a")
+                # one write per line, lines from several processes appending to the file don't mix
+                self._file.write(json.dumps(record, default=lambda v: v.item()) + "\n")
+                self._file.flush()
+
+    def summary(self):
+        """
+        Totals per stage as a text table (calls, wall, CPU, rows, HTTP, cache hit rate), in the order stages
+        first finished.
+        """
+        lines = [f"{'stage':<32} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'rows':>11} "
+                 f"{'http':>5} {'MB':>8} {'http s':>8} {'cache':>6}"]
+        with self._lock:
+            totals = dict(self.totals)
+        for path, t in totals.items():
+            lookups = t["cache_hits"] + t["cache_misses"]
+            cache = f"{t['cache_hits'] / lookups:6.0%}" if lookups else f"{'':>6}"
+            lines.append(f"{path:<32} {t['calls']:>6} {t['wall_s']:>9.3f} {t['cpu_s']:>9.3f} {t['rows']:>11,} "
+                         f"{t['http_requests']:>5} {t['http_bytes'] / 1024**2:>8.2f} {t['http_seconds']:>8.3f} {cache}")
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append(f"peak RSS {rss:.0f} MB")
+        return "\n".join(lines)
+
+    def prometheus_text(self):
+        # running totals in Prometheus text exposition format
+        metrics = (("wps_stage_calls_total", "calls", "Finished stages"),
+                   ("wps_stage_wall_seconds_total", "wall_s", "Wall time spent in the stage"),
+                   ("wps_stage_cpu_seconds_total", "cpu_s", "Process CPU time spent in the stage"),
+                   ("wps_stage_rows_total", "rows", "Rows/features handled"),
+                   ("wps_stage_http_requests_total", "http_requests", "HTTP requests sent"),
+                   ("wps_stage_http_bytes_total", "http_bytes", "HTTP response bytes received"),
+                   ("wps_stage_http_seconds_total", "http_seconds", "Seconds waiting on HTTP responses"),
+                   ("wps_stage_cache_hits_total", "cache_hits", "Weather cache hits"),
+                   ("wps_stage_cache_misses_total", "cache_misses", "Weather cache misses"))
+        with self._lock:
+            totals = dict(self.totals)
+        lines = []
+        for metric, key, help_text in metrics:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{stage="{path}"}} {t[key]}' for path, t in totals.items()]
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines += ["# HELP wps_process_peak_rss_bytes Peak resident memory of the process",
+                      "# TYPE wps_process_peak_rss_bytes gauge", f"wps_process_peak_rss_bytes {rss * 1024**2:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the totals at http://<host>:<port>/metrics from a background thread, for as long as the process runs.
+        """
+        recorder = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = recorder.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+
+# one recorder per process, used through the functions below
+RECORDER = StageRecorder(os.environ.get(METRICS_PATH_ENV) or None, os.environ.get(METRICS_RUN_ENV))
+
+
+def configure(path=None, port=None):
+    """
+    Switch on output for this process (and worker processes started after this).
+
+    Inputs:
+    - path: JSON lines file to append finished stages to, None to leave as is
+    - port: serve Prometheus text format on this local port, None for no endpoint
+    """
+    if path:
+        RECORDER.path = path
+        os.environ[METRICS_PATH_ENV] = path
+        os.environ[METRICS_RUN_ENV] = RECORDER.run
+    if port:
+        RECORDER.serve(port)
+    return RECORDER
+
+
+def stage(name, rows=0):
+    return RECORDER.stage(name, rows)
+
+
+def start(name, rows=0):
+    return RECORDER.start(name, rows)
+
+
+def timed(name, rows=None):
+    return RECORDER.timed(name, rows)
+
+
+def count(**counts):
+    RECORDER.count(**counts)
+
+
+def summary():
+    return RECORDER.summary()
+
+
+def current_path():
+    return RECORDER.current_path()
+
+
+def reset_worker(prefix=None):
+    # process pool initializer, see the module notes
+    RECORDER.reset(prefix)
+
+
+def take_totals():
+    return RECORDER.take_totals()
+
+
+def merge(totals):
+    RECORDER.merge(totals)
@@ -9,28 +9,36 @@ Dependencies: Python, Matplotlib, Geopandas, Pandas, Shapely
 Use by calling file name with the alphanumeric fire number you are interested in seing evaluated
 >>python3 compare.py K52125
 >>python3 compare V82990 
+Batch (headless) validation of many fires, or every fire in the lookup table, written to one metrics table:
+>>python3 compare.py --batch K52125 V82990 --workers 4
+>>python3 compare.py --batch --out ../data/2023_model_validation.csv
+CSI/bias curves over every simulation hour (single fire, or --batch for a table):
+>>python3 compare.py K52125 --hours
+Per stage timings (load, overlay, write...) as JSON lines and a summary table, see instrumentation.py at the repo root:
+>>python3 compare.py --batch --metrics ../data/validation_metrics.jsonl
 
 Notes:
 -Not all fires have data. The script is currenlty written to compare cases where all three inputs have data.
 -Firecast simulations all run for exactly 12 hours from ignition time. Technosylva simulations have more variation, but the script ties to get data for an hour as close to 12 as possible.
 -The observed perimeter is fetched from he most recently available file after the two simulations end. This may mean that the observed data is often represnting a time much later than the simulations.
     Please check thye terminal outputs to see the dates.
+-Importing this file does no I/O, doesn't touch sys.path and only loads pandas. Geopandas/shapely, the perimeter catalogue,
+    simulation index and hotspot store are imported by the functions that use them, matplotlib (and the Qt backend) only
+    when a plot is made, so batch workers start quickly and run on servers without a display.
+-In batch mode nothing is plotted or asked. When a fire has several Technosylva simulations one is picked by
+    select_simulation (shortest duration >= 12h, then earliest forecast time), so reruns score the same simulations.
 
 '''
 
 
 
-import matplotlib
-matplotlib.use('Qt5Agg')
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import matplotlib.lines as mlines
 import pandas as pd
 import os
 import sys
-from shapely.geometry import box, MultiPolygon
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, wraps
 from datetime import datetime, timedelta
-import re
 
 
 lookup_table_path = "../data/2023_fire_season_lookup_table.xlsx"
@@ -38,23 +46,82 @@ perimeters_path = "../data/2023_fire_perimeters/interrim_perims/polys"
 technosylva_folder_path = "/mnt/e/MODELS/TECHNOSYLVA/simulations/"
 firecast_folder_path = "/mnt/e/MODELS/FIRECAST/simulations/"
 firms_path = "../data/2023_firms/fire_archive_SV-C2_493123.shp"
+perimeter_catalogue_path = "../data/2023_fire_perimeters/perimeter_catalogue.parquet"
+simulation_index_path = "../data/2023_simulation_index.parquet"
+fire_season = 2023
+validation_output_path = f"../data/{fire_season}_model_validation.csv"
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+
+def get_instrumentation():
+    # instrumentation.py is shared with the forecast scripts at the repo root. it's imported on first use, not when
+    # this file is, and the repo root only goes on the path when it isn't importable already (run from model_comparison/py)
+    try:
+        import instrumentation
+    except ImportError:
+        sys.path.append(repo_root)
+        import instrumentation
+    return instrumentation
+
+
+def timed(name, rows=None):
+    # instrumentation.timed, looked up when the function runs
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_instrumentation().timed(name, rows)(func)(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@lru_cache(maxsize=None)
+@timed('load_index')
+def get_simulation_index():
+    # simulation stores and lookup table are checked once per process, lookups after that are table queries
+    from simulation_index import SimulationIndex
+    index = SimulationIndex(simulation_index_path, firecast_folder_path, technosylva_folder_path, lookup_table_path)
+    index.refresh()
+    return index
+
+
+def load_lookup_table():
+    # Technosylva lookup table rows, served from the simulation index
+    return get_simulation_index().technosylva_lookup()
+
+
+def select_simulation(matching_rows):
+    """
+    Deterministic choice between several Technosylva simulations of the same fire, used when nobody is there to pick.
+    Takes the shortest simulation that still covers the study duration, then the earliest forecast time,
+    then the Sim_unique name, so the same lookup table always gives the same simulation.
+
+    Inputs:
+    - matching_rows: lookup table rows for one fire, already filtered to DURATION_HOURS >= simulation_duration
+
+    Outputs:
+    - the chosen row (pandas Series)
+    """
+    ordered = matching_rows.sort_values(['DURATION_HOURS', 'FORECAST_TIMESTAMP', 'Sim_unique'], kind='mergesort')
+    return ordered.iloc[0]
 
 
-def lookup_technosylva(fire_name, simulation_duration=12):
+def lookup_technosylva(fire_name, simulation_duration=12, interactive=True):
     """
     Function to lookup corresponding Technosylva data folder from an input fire name.
     If multiple files are associated with the fire name, forces the user to choose, but only files with a DURATION_HOURS of simulation_duration will be shown for selection.
+    With interactive=False the choice is made by select_simulation instead.
 
     Inputs:
     - fire_name: The fire name (e.g., "Inks Lake Fire") or number (e.g., 'K52125').
     - simulation_duration: Integer representing time in hours for desired simulations. Set to 12 for this study, can be changed for future use.
+    - interactive: Bool value of whether the user is asked to choose between several simulations
 
     Outputs:
     - Path to the chosen file.
     """
     
     # Read the CSV/Excel assuming it has headers
-    df = pd.read_excel(lookup_table_path, engine='openpyxl')  # Adjust path if necessary
+    df = load_lookup_table()  # Adjust lookup_table_path if necessary
     
     # Find all rows where the 'NUMBER' column matches the fire name
     matching_rows = df[df['NUMBER'] == fire_name]
@@ -79,6 +146,11 @@ def lookup_technosylva(fire_name, simulation_duration=12):
         print(f"Corresponding FORECAST_TIMESTAMP: {timestamp}")
         return os.path.join(technosylva_folder_path, sim_unique, "Perimeters.geojson"), timestamp
     
+    elif not interactive:
+        chosen = select_simulation(matching_rows_12h)
+        print(f"Selected file: {chosen['Sim_unique']} (forecast time: {chosen['FORECAST_TIMESTAMP']}) out of {len(sim_unique_files)}")
+        return os.path.join(technosylva_folder_path, chosen['Sim_unique'], "Perimeters.geojson"), chosen['FORECAST_TIMESTAMP']
+
     else:
         # If there are multiple files, user chooses which one
         print(f"Multiple files found for fire name '{fire_name}' with DURATION_HOURS == {simulation_duration}:")
@@ -102,11 +174,25 @@ def lookup_technosylva(fire_name, simulation_duration=12):
                 print("Invalid input. Please enter a valid number.")
 
 
-def load_technosylva(fire_number, simulation_duration=12):
+@timed('load_technosylva', rows=len)
+def read_technosylva(geojson_path):
+    # every hourly perimeter of a Technosylva simulation, in EPSG:3005 with a numeric 'hour' column
+    # Load the GeoJSON 
+    import geopandas as gpd
+    gdf = gpd.read_file(geojson_path)
+    # Reproject the GeoDataFrame to EPSG:3005 
+    gdf = gdf.to_crs(epsg=3005)
+    #Encountered some issues with weird newlines, coerce into readable format
+    gdf['hour'] = pd.to_numeric(gdf['hour'], errors='coerce')
+    return gdf
+
+
+def load_technosylva(fire_number, simulation_duration=12, interactive=True):
     """
     Function which loads Technosylva fire growth model geojson data
     Inputs:
     - fire_number: Alphanumeric fire number (as per BCWS categorization system)
+    - interactive: Bool value of whether the user chooses between several simulations (see lookup_technosylva)
 
     Outputs:
     - Tuple containing:
@@ -114,14 +200,8 @@ def load_technosylva(fire_number, simulation_duration=12):
       - Timestamp of the selected data
     """
     # Get path and timestamp
-    geojson_path, timestamp = lookup_technosylva(fire_number)
-    
-    # Load the GeoJSON 
-    gdf = gpd.read_file(geojson_path)
-    # Reproject the GeoDataFrame to EPSG:3005 
-    gdf = gdf.to_crs(epsg=3005)
-    #Encountered some issues with weird newlines, coerce into readable format
-    gdf['hour'] = pd.to_numeric(gdf['hour'], errors='coerce')
+    geojson_path, timestamp = lookup_technosylva(fire_number, simulation_duration, interactive)
+    gdf = read_technosylva(geojson_path)
     
     # Check for rows where 'hour' matches the simulation_duration
     matching_rows = gdf[gdf['hour'] == simulation_duration]
@@ -134,7 +214,7 @@ def load_technosylva(fire_number, simulation_duration=12):
     else:
         # If no rows match, select the row with the latest hour
         latest_hour = gdf['hour'].max()
-        gdf = gdf['hour']
+        gdf = gdf[gdf['hour'] == latest_hour].iloc[[0]]
         print(f"Warning: No data for hour {simulation_duration}. Using the latest available hour: {latest_hour}.")
     print('Technosylva data loaded')
     return gdf, timestamp, latest_hour
@@ -153,50 +233,20 @@ def lookup_firecast(fire_number, target_date):
     - The datetime of the selected shapefile
     """
     # Append the fire_number to the root folder path
-    subfolder = 'BCWS_2023_' + str(fire_number)
+    subfolder = f'BCWS_{fire_season}_' + str(fire_number)
     full_path = os.path.join(firecast_folder_path, subfolder)
-    
-    # Ensure the full path exists
-    if not os.path.isdir(full_path):
-        raise ValueError(f"The path {full_path} does not exist or is not a directory.")
-    
-    closest_folder = None
-    closest_date_diff = None
-    
-    # Traverse the subfolders
-    for folder_name in sorted(os.listdir(full_path)):
-        folder_path = os.path.join(full_path, folder_name)
-        
-        # Check if the current item is a directory
-        if os.path.isdir(folder_path):
-            # Extract the date from the folder name (e.g., 20230815101011)
-            match = re.search(r'_(\d{8})(\d{6})', folder_name)
-            if match:
-                folder_date_str = match.group(1) + match.group(2)  # Combine the date and time
-                folder_date = datetime.strptime(folder_date_str, "%Y%m%d%H%M%S")
-                
-                # Calculate the difference between the folder date and the target date
-                date_diff = abs((folder_date - target_date).total_seconds())
-                
-                # Update closest folder if this is the closest one so far
-                if closest_date_diff is None or date_diff < closest_date_diff:
-                    closest_date_diff = date_diff
-                    closest_folder = folder_path
-    
-    # If no folder was found, raise an error
-    if closest_folder is None:
-        raise FileNotFoundError(f"No suitable folder found under {full_path}.")
-
-    # Now look for the .shp file inside the closest folder
-    for file_name in os.listdir(closest_folder):
-        if file_name.endswith(".shp"):
-            # Extract the timestamp from the shapefile
-            timestamp = datetime.strptime(re.search(r'_(\d{8}\d{6})_', file_name).group(1), "%Y%m%d%H%M%S")
-            print(f'Found file: {file_name}')
-            return os.path.join(closest_folder, file_name), timestamp
-    
+
+    # Run folders come from the simulation index (see simulation_index.py) instead of listing the share
+    try:
+        closest = get_simulation_index().closest_firecast(fire_number, target_date, season=fire_season)
+    except ValueError:
+        raise ValueError(f"No FireCast run folders indexed under {full_path}.")
+
     # If no shapefile found, raise an error
-    raise FileNotFoundError(f"No .shp file found in folder {closest_folder}.")
+    if closest['path'] is None or pd.isna(closest['path']):
+        raise FileNotFoundError(f"No .shp file found in folder {closest['folder']}.")
+    print(f"Found file: {os.path.basename(closest['path'])}")
+    return closest['path'], closest['end_time'].to_pydatetime()
 
 
 def load_firecast(fire_number, target_date):
@@ -208,17 +258,71 @@ def load_firecast(fire_number, target_date):
     Outputs:
     - geodataframe containing polygon of most recent time in simulation
     """
+    import geopandas as gpd
     shp_path, timestamp = lookup_firecast(fire_number, target_date)
-    shp_gdf= gpd.read_file(shp_path)
-    shp_gdf = shp_gdf.to_crs(epsg=3005)
+    with get_instrumentation().stage('load_firecast') as stage:
+        shp_gdf= gpd.read_file(shp_path)
+        shp_gdf = shp_gdf.to_crs(epsg=3005)
+        stage.rows = len(shp_gdf)
     print('Firecast data loaded')
     return shp_gdf.iloc[[-1]], timestamp
 
 
+def load_technosylva_hours(fire_number, simulation_duration=12, interactive=False):
+    """
+    Every hourly perimeter of the Technosylva simulation (instead of only the final hour), read and projected once.
+
+    Inputs:
+    - fire_number: Alphanumeric fire number (as per BCWS categorization system)
+    - interactive: Bool value of whether the user chooses between several simulations (see lookup_technosylva)
+
+    Outputs:
+    - geodataframe with one dissolved perimeter per hour, columns 'hour' and 'time', sorted by hour
+    - forecast start time
+    """
+    geojson_path, timestamp = lookup_technosylva(fire_number, simulation_duration, interactive)
+    gdf = read_technosylva(geojson_path).dropna(subset=['hour'])
+    gdf = gdf.dissolve(by='hour').reset_index()[['hour', 'geometry']]
+    gdf['time'] = pd.Timestamp(timestamp) + pd.to_timedelta(gdf['hour'], unit='h')
+    print(f'Technosylva data loaded ({len(gdf)} hours)')
+    return gdf, timestamp
+
+
+def load_firecast_hours(fire_number, target_date):
+    """
+    Every perimeter in the FireCast output (instead of only the last row), read and projected once.
+    FireCast shapefiles don't carry an hour, the rows are taken as evenly spaced time steps in file order from
+    the run start (run folder time) to the output time (shapefile name).
+
+    Inputs:
+    - fire_number: Alphanumeric fire number (as per BCWS categorization system)
+    - target_date: datetime, the run starting closest to it is used (as in lookup_firecast)
+
+    Outputs:
+    - geodataframe with one perimeter per step, columns 'hour' and 'time'
+    - run start time
+    """
+    import geopandas as gpd
+    shp_path, end_time = lookup_firecast(fire_number, target_date)
+    start_time = get_simulation_index().closest_firecast(fire_number, target_date, season=fire_season)['start_time']
+    with get_instrumentation().stage('load_firecast') as stage:
+        shp_gdf = gpd.read_file(shp_path).to_crs(epsg=3005)
+        stage.rows = len(shp_gdf)
+    duration = (pd.Timestamp(end_time) - start_time) / pd.Timedelta(hours=1)
+    steps = len(shp_gdf)
+    shp_gdf = shp_gdf[['geometry']].reset_index(drop=True)
+    shp_gdf['hour'] = [duration*(i + 1)/steps for i in range(steps)]
+    shp_gdf['time'] = start_time + pd.to_timedelta(shp_gdf['hour'], unit='h')
+    print(f'Firecast data loaded ({steps} steps)')
+    return shp_gdf, start_time.to_pydatetime()
+
+
+@timed('load_perimeter', rows=lambda result: len(result[0]))
 def load_perimeter(fire_number, event_date_1, event_date_2):
     """
     Function to load fire perimeter data based on two datetime objects,
     selecting the subfolder which has the earliest date that comes after both input dates.
+    Uses the perimeter catalogue (see perimeter_catalogue.py) when it has been built, otherwise reads the snapshot folders one by one.
     
     Inputs:
     - fire_number: Alphanumeric fire number (as per BCWS categorization system)
@@ -229,7 +333,19 @@ def load_perimeter(fire_number, event_date_1, event_date_2):
     - geodataframe containing polygon of fire as seen in the selected subfolder
     - datetime object of the selected subfolder's date
     """
+    import geopandas as gpd
+    from shapely.geometry import MultiPolygon
+    from perimeter_catalogue import first_perimeter_after
     
+    if os.path.exists(perimeter_catalogue_path):
+        perimeter_gdf, selected_date = first_perimeter_after(perimeter_catalogue_path, fire_number,
+                                                             max(event_date_1, event_date_2))
+        print('Perimeter loaded')
+        perimeter_gdf = perimeter_gdf.copy()
+        perimeter_gdf.loc[perimeter_gdf['geometry'].geom_type == 'Polygon', 'geometry'] = perimeter_gdf.loc[perimeter_gdf['geometry'].geom_type == 'Polygon', 'geometry'].apply(lambda geom: MultiPolygon([geom]))
+        return perimeter_gdf, selected_date
+    print(f'No perimeter catalogue at {perimeter_catalogue_path}, reading snapshot folders (build it with perimeter_catalogue.py)')
+
     # Convert input datetime objects to timestamp format
     event_date_1_timestamp = event_date_1.timestamp()
     event_date_2_timestamp = event_date_2.timestamp()
@@ -284,40 +400,110 @@ def load_perimeter(fire_number, event_date_1, event_date_2):
     raise ValueError(f"No polygon found for fire number {fire_number} in any valid folder after both event dates.")
 
             
+def as_geometry(data):
+    """
+    Dissolve a geodataframe into a single shapely geometry (passes shapely geometries straight through).
+    Dissolving once up front means a perimeter scored against several models is only unioned once.
+
+    Inputs:
+    - data: geodataframe/geoseries, or a shapely geometry
+
+    Outputs:
+    - shapely geometry covering every polygon in data
+    """
+    from shapely.geometry.base import BaseGeometry
+    from shapely.ops import unary_union
+    if isinstance(data, BaseGeometry):
+        return data
+    return unary_union(data.geometry.values)
+
+
+def polygon_parts(geometry):
+    # individual polygons of a (multi)polygon or geometry collection, empty parts dropped
+    if geometry.is_empty:
+        return []
+    if hasattr(geometry, 'geoms'):
+        return [part for geom in geometry.geoms for part in polygon_parts(geom)]
+    return [geometry] if geometry.area > 0 else []
+
+
+def intersection_area(geom_a, geom_b, prepared_b=None):
+    """
+    Area (in m^2) where two dissolved geometries overlap.
+    Skips the overlay entirely when one geometry is inside the other or they don't touch,
+    otherwise only intersects the polygon parts whose bounding boxes overlap (STRtree).
+    prepared_b: prep(geom_b), when geom_b is intersected with many geometries
+    """
+    from shapely.prepared import prep
+    from shapely.strtree import STRtree
+    prepared_a = prep(geom_a)
+    if not prepared_a.intersects(geom_b):
+        return 0.0
+    if prepared_a.contains(geom_b):
+        return geom_b.area
+    if (prepared_b or prep(geom_b)).contains(geom_a):
+        return geom_a.area
+    # parts of a dissolved geometry don't overlap each other, so the pairwise areas add up exactly
+    parts_a = polygon_parts(geom_a)
+    parts_b = polygon_parts(geom_b)
+    tree = STRtree(parts_a)
+    area = 0.0
+    for part_b in parts_b:
+        for i in tree.query(part_b):
+            area += parts_a[i].intersection(part_b).area
+    return area
+
+
+@timed('overlay', rows=lambda result: 1)
 def compute_areas(observed, predicted):
     """
     Compute areas of overlap and uniqueness for predicted and obsered data
+    The intersection is the only overlay done, the other two areas follow from the totals:
+    area(predicted) = A + B and area(observed) = A + C
     Inputs:
-    - observed: geodataframe of observed data (from periemters shapefile, sentinel-2 cutting, etc.)
-    - predicted: geodataframe of predicted data (from TechnoSylva simulations or FireCast simulations)
+    - observed: geodataframe of observed data (from periemters shapefile, sentinel-2 cutting, etc.), or its dissolved geometry
+    - predicted: geodataframe of predicted data (from TechnoSylva simulations or FireCast simulations), or its dissolved geometry
 
     Outputs:
-    - area_only_observed: Area (in m^2) in the observed polygon but not the predicted polygon
-    - area_only_predictes: Area (in m^2) in the predicted polygon but not the observed polygon
     - area_intersection: Area (in m^2) where the polygons overlap
+    - area_only_predictes: Area (in m^2) in the predicted polygon but not the observed polygon
+    - area_only_observed: Area (in m^2) in the observed polygon but not the predicted polygon
     """
-    # Compute the differences and intersection areas
-    # Area in the selected shapefile polygon but not in the max_hour_polygon from the GeoJSON
-    only_observed = observed.overlay(predicted, how='difference', keep_geom_type = False)
-    area_only_observed = only_observed.geometry.area.sum()
+    observed = as_geometry(observed)
+    predicted = as_geometry(predicted)
 
-    # 2. Area in the max_hour_polygon but not in the selected shapefile polygon
-    only_predicted = predicted.overlay(observed, how='difference', keep_geom_type = False)
-    area_only_predicted= only_predicted.geometry.area.sum()
-
-    # 3. Area in the intersection of selected shapefile polygon and max_hour_polygon
-    intersection = predicted.overlay(observed, how='intersection', keep_geom_type = False)
-    area_intersection = intersection.geometry.area.sum()
+    area_intersection = intersection_area(predicted, observed)
+    # clip tiny negative round-off when one polygon sits exactly inside the other
+    area_only_predicted = max(predicted.area - area_intersection, 0.0)
+    area_only_observed = max(observed.area - area_intersection, 0.0)
 
     return area_intersection, area_only_predicted, area_only_observed
 
+def skill_scores_from_areas(A, B, C):
+    """
+    Skill scores from the three areas of compute_areas (no overlay, no printing), NaN where a score is undefined
+    (no observed or no predicted area).
+
+    Inputs:
+    - A, B, C: area of intersection, area only predicted, area only observed (m^2)
+
+    Outputs:
+    - bias, hit_rate, false_alarm_ratio, critical_success_index
+    """
+    bias = (A+B)/(A+C) if A+C else float('nan')
+    hit_rate = A/(A+C) if A+C else float('nan')
+    false_alarm_ratio = 1 - A/(A+B) if A+B else float('nan')
+    critical_success_index = A/(A+B+C) if A+B+C else float('nan')
+    return bias, hit_rate, false_alarm_ratio, critical_success_index
+
+
 def get_skill_scores(observed, forecast):
     """
     Compute prediction skill score based on Brett Moore's thesis pg 39
     Inpputs are expected to have been put through compare_rasters first.
     Parameters:
-    - observed: geodataframe of observed data (from periemters shapefile, sentinel-2 cutting, etc.)
-    - predicted: geodataframe of predicted data (from TechnoSylva simulations or FireCast simulations)
+    - observed: geodataframe of observed data (from periemters shapefile, sentinel-2 cutting, etc.), or its dissolved geometry (as_geometry)
+    - predicted: geodataframe of predicted data (from TechnoSylva simulations or FireCast simulations), or its dissolved geometry
   
     Returns:
     - bias (float32) : Magnitude of under/over prediction
@@ -328,10 +514,7 @@ def get_skill_scores(observed, forecast):
     #Get areas:
     A, B, C = compute_areas(observed, forecast)
     #Calculate 
-    bias = (A+B)/(A+C)
-    hit_rate = A/(A+C)
-    false_alarm_ratio = 1 - A/(A+B)
-    critical_success_index = A/(A+B+C)
+    bias, hit_rate, false_alarm_ratio, critical_success_index = skill_scores_from_areas(A, B, C)
 
     print(f'bias : {bias}')
     print(f'hit rate: {hit_rate}')
@@ -354,6 +537,10 @@ def plot_data(observed, start_date, technosylva, firecast, plot_hotspots=True, s
     Returns:
     - None, shows a plot and prints skill scores
     """
+    import matplotlib.pyplot as plt
+    import matplotlib.lines as mlines
+    from hotspots import load_hotspots
+
     # Plot the selected shapefile polygon and the GeoJSON polygon
     fig, ax = plt.subplots(figsize=(10, 10))
 
@@ -363,29 +550,26 @@ def plot_data(observed, start_date, technosylva, firecast, plot_hotspots=True, s
     firecast.plot(ax=ax, color='green', alpha=0.3, edgecolor='green', linewidth=1, label='Firecast Forecast')
 
     if plot_hotspots:
-        # Read in FIRMS hotspot data
-        firms_gdf = gpd.read_file(firms_path)
-        firms_gdf = firms_gdf.to_crs(epsg=3005)
+        # FIRMS hotspot data, read and projected once per process (see hotspots.py)
+        hotspots = load_hotspots(firms_path)
         
         # Get limits to get hotspots in plotting range
         x_limits = plt.gca().get_xlim()  
         y_limits = plt.gca().get_ylim()  
 
-        # Spatial filter: Use GeoPandas' within method to filter the points that fall within the bounding box
-        bounding_box = box(x_limits[0], y_limits[0], x_limits[1], y_limits[1])
-        firms_gdf = firms_gdf[firms_gdf.geometry.within(bounding_box)]
-
-        # Temporal filter: Get hotspots within a specific time range
+        # Spatial and temporal filter in one indexed query: hotspots in the plotting range acquired within the time range
         start_time = start_date - timedelta(hours=24)
         end_time = start_date + timedelta(hours=simulation_time)
-        firms_gdf = firms_gdf[(firms_gdf['ACQ_DATE'] >= start_time) & (firms_gdf['ACQ_DATE'] <= end_time)]
+        firms_gdf = hotspots.points(hotspots.query((x_limits[0], y_limits[0], x_limits[1], y_limits[1]), start_time, end_time))
         
         # Plot hotspots as points (scatter)
         firms_gdf.plot(ax=ax, color='black', markersize=10, label='FIRMS hotspots', marker='o')
 
     if show_values:
-        bias_fc, hit_rate_fc, false_alarms_fc, csi_fc = get_skill_scores(observed, firecast)
-        bias_ts, hit_rate_ts, false_alarms_ts, csi_ts = get_skill_scores(observed, technosylva)
+        # dissolve the perimeter once, it's scored against both models
+        observed_geometry = as_geometry(observed)
+        bias_fc, hit_rate_fc, false_alarms_fc, csi_fc = get_skill_scores(observed_geometry, firecast)
+        bias_ts, hit_rate_ts, false_alarms_ts, csi_ts = get_skill_scores(observed_geometry, technosylva)
 
     # Add labels and legend
     ax.set_title(f'Fire perimeters for fire number {fire_number}', fontsize=14)
@@ -415,10 +599,283 @@ def plot_data(observed, start_date, technosylva, firecast, plot_hotspots=True, s
     plt.show()
 
 
+def score_fire(fire_number, simulation_duration=12):
+    """
+    Headless version of the single fire comparison: loads both simulations and the matching perimeter
+    and scores them, no plots and no prompts.
+
+    Inputs:
+    - fire_number: Alphanumeric fire number (as per BCWS categorization system)
+    - simulation_duration: Time of simulation to consider (hours)
+
+    Outputs:
+    - list of dicts, one row per model, with the data times, areas (m^2) and skill scores
+    """
+    technosylva, timestamp_ts, latest_hour = load_technosylva(fire_number, simulation_duration, interactive=False)
+    firecast, timestamp_fc = load_firecast(fire_number, timestamp_ts)
+    perimeter, timestamp_perim = load_perimeter(fire_number, timestamp_ts, timestamp_fc)
+    observed_geometry = as_geometry(perimeter)
+
+    rows = []
+    for model_name, predicted, timestamp, hour in (('Technosylva', technosylva, timestamp_ts, latest_hour),
+                                                   ('Firecast', firecast, timestamp_fc, simulation_duration)):
+        # one overlay per model, the scores follow from its areas
+        A, B, C = compute_areas(observed_geometry, predicted)
+        bias, hit_rate, false_alarm_ratio, critical_success_index = skill_scores_from_areas(A, B, C)
+        rows.append({
+            'fire_number': fire_number, 'model': model_name,
+            'simulation_time': timestamp, 'simulation_hour': hour, 'perimeter_time': timestamp_perim,
+            'area_intersection': A, 'area_only_predicted': B, 'area_only_observed': C,
+            'bias': bias, 'hit_rate': hit_rate, 'false_alarm_ratio': false_alarm_ratio,
+            'critical_success_index': critical_success_index, 'error': None
+        })
+    return rows
+
+
+@timed('overlay', rows=len)
+def skill_curve(hourly, observed):
+    """
+    Skill scores of every hour of a simulation against one observed perimeter.
+    The observed perimeter is dissolved and prepared once, then each hour is one intersection_area call.
+    (Carrying the intersection over from the previous hour doesn't pay: the difference that gives the new ring
+    is itself a full overlay, and costs more than intersecting the whole perimeter.)
+
+    Inputs:
+    - hourly: geodataframe of perimeters in time order (from load_technosylva_hours/load_firecast_hours)
+    - observed: geodataframe of the observed perimeter, or its dissolved geometry
+
+    Outputs:
+    - list of dicts, one per hour, with the areas and skill scores
+    """
+    from shapely.prepared import prep
+    observed = as_geometry(observed)
+    prepared_observed = prep(observed)
+    rows = []
+    for hour, time, predicted in zip(hourly['hour'], hourly['time'], hourly.geometry):
+        A = intersection_area(predicted, observed, prepared_observed)
+        B = max(predicted.area - A, 0.0)
+        C = max(observed.area - A, 0.0)
+        bias, hit_rate, false_alarm_ratio, critical_success_index = skill_scores_from_areas(A, B, C)
+        rows.append({
+            'simulation_hour': hour, 'time': time,
+            'area_intersection': A, 'area_only_predicted': B, 'area_only_observed': C,
+            'bias': bias, 'hit_rate': hit_rate, 'false_alarm_ratio': false_alarm_ratio,
+            'critical_success_index': critical_success_index
+        })
+    return rows
+
+
+@timed('hotspots', rows=len)
+def hotspot_curve(hourly, start_time, hotspots, extent):
+    """
+    Share of the hotspots detected since the simulation started that fall inside each hour's perimeter.
+
+    Inputs:
+    - hourly: geodataframe of perimeters in time order
+    - start_time: simulation start
+    - hotspots: HotspotStore in EPSG:3005 (see hotspots.py)
+    - extent: (minx, miny, maxx, maxy) to look for hotspots in, normally the fire's surroundings
+
+    Outputs:
+    - list of (hotspots detected so far, share inside the perimeter) per hour
+    """
+    values = []
+    for time, predicted in zip(hourly['time'], hourly.geometry):
+        idx = hotspots.query(extent, start_time, time)
+        if len(idx) == 0:
+            values.append((0, float('nan')))
+            continue
+        inside = len(hotspots.within(predicted, start_time, time))
+        values.append((len(idx), inside/len(idx)))
+    return values
+
+
+def score_fire_hours(fire_number, simulation_duration=12, lag_hours=24, with_hotspots=True):
+    """
+    CSI/bias curves over time: every hour of both simulations scored against every observed perimeter snapshot
+    taken between the simulation start and lag_hours after it ends, plus the hotspot share per hour.
+
+    Inputs:
+    - fire_number: Alphanumeric fire number (as per BCWS categorization system)
+    - simulation_duration: Time of simulation to consider (hours)
+    - lag_hours: how long after the simulation ends observed perimeters are still used
+    - with_hotspots: Bool value of whether the FIRMS hotspot share is added
+
+    Outputs:
+    - dataframe with one row per model, observed snapshot and simulation hour
+    """
+    from perimeter_catalogue import read_catalogue
+    from hotspots import load_hotspots
+    technosylva, timestamp_ts = load_technosylva_hours(fire_number, simulation_duration)
+    firecast, timestamp_fc = load_firecast_hours(fire_number, timestamp_ts)
+
+    rows = []
+    for model_name, hourly, start_time in (('Technosylva', technosylva, timestamp_ts),
+                                           ('Firecast', firecast, timestamp_fc)):
+        end_time = pd.Timestamp(start_time) + pd.Timedelta(hours=simulation_duration + lag_hours)
+        if os.path.exists(perimeter_catalogue_path):
+            snapshots = read_catalogue(perimeter_catalogue_path, fire_number, after=start_time, before=end_time)
+            snapshots = [(time, group) for time, group in snapshots.groupby('SNAPSHOT_TIME')]
+        else:
+            perimeter, timestamp_perim = load_perimeter(fire_number, start_time, start_time)
+            snapshots = [(pd.Timestamp(timestamp_perim), perimeter)]
+
+        hotspot_values = None
+        if with_hotspots:
+            with get_instrumentation().stage('load_hotspots'):
+                hotspots = load_hotspots(firms_path)
+            minx, miny, maxx, maxy = hourly.total_bounds
+            # a few km around the simulation, where this fire's hotspots would be
+            extent = (minx - 5000, miny - 5000, maxx + 5000, maxy + 5000)
+            hotspot_values = hotspot_curve(hourly, start_time, hotspots, extent)
+
+        for snapshot_time, perimeter in snapshots:
+            for i, row in enumerate(skill_curve(hourly, perimeter)):
+                row.update(fire_number=fire_number, model=model_name, simulation_time=start_time,
+                           perimeter_time=snapshot_time)
+                if hotspot_values is not None:
+                    row['hotspots'], row['hotspot_share_inside'] = hotspot_values[i]
+                rows.append(row)
+
+    columns = ['fire_number', 'model', 'simulation_time', 'simulation_hour', 'time', 'perimeter_time',
+               'area_intersection', 'area_only_predicted', 'area_only_observed',
+               'bias', 'hit_rate', 'false_alarm_ratio', 'critical_success_index', 'hotspots', 'hotspot_share_inside']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def plot_skill_curves(curves, save_path=None):
+    """
+    CSI and bias against simulation hour, one line per model and observed snapshot.
+
+    Inputs:
+    - curves: dataframe from score_fire_hours
+    - save_path: save the figure to this file instead of showing it
+    """
+    import matplotlib.pyplot as plt
+
+    fig, (ax_csi, ax_bias) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+    colors = {'Technosylva': 'red', 'Firecast': 'green'}
+    for (model_name, snapshot_time), curve in curves.groupby(['model', 'perimeter_time']):
+        label = f'{model_name} vs perimeter {snapshot_time:%Y-%m-%d %H:%M}'
+        ax_csi.plot(curve['simulation_hour'], curve['critical_success_index'], color=colors.get(model_name), alpha=0.7, label=label)
+        ax_bias.plot(curve['simulation_hour'], curve['bias'], color=colors.get(model_name), alpha=0.7, label=label)
+    ax_csi.set_ylabel('CSI')
+    ax_bias.set_ylabel('Bias')
+    ax_bias.axhline(1, color='black', linewidth=0.5)
+    ax_bias.set_xlabel('Simulation hour')
+    ax_csi.legend(fontsize=8)
+    ax_csi.set_title(f'Skill over time for fire number {curves["fire_number"].iloc[0]}')
+    if save_path:
+        fig.savefig(save_path)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def _score_fire_task(task):
+    # process pool worker, a fire that can't be scored becomes an error row instead of stopping the batch
+    fire_number, simulation_duration, hourly = task
+    try:
+        with get_instrumentation().stage('fire'):
+            if hourly:
+                return score_fire_hours(fire_number, simulation_duration).to_dict('records')
+            return score_fire(fire_number, simulation_duration)
+    except Exception as e:
+        return [{'fire_number': fire_number, 'model': None, 'error': f'{type(e).__name__}: {e}'}]
+
+
+def _score_fire_worker(task):
+    # _score_fire_task in a pool worker, with the worker's stage totals for the parent to merge
+    return _score_fire_task(task), get_instrumentation().take_totals()
+
+
+def validate_season(fire_numbers=None, workers=4, out_path=validation_output_path, simulation_duration=12, hourly=False):
+    """
+    Score FireCast and Technosylva against the observed perimeters for many fires, in parallel.
+
+    Inputs:
+    - fire_numbers: list of fire numbers, None for every fire in the lookup table
+    - workers: number of processes, 1 runs every fire in this process
+    - out_path: csv the metrics table is written to, None to skip writing
+    - simulation_duration: Time of simulation to consider (hours)
+    - hourly: Bool value of whether every simulation hour is scored against every observed snapshot (score_fire_hours)
+
+    Outputs:
+    - dataframe with one row per fire and model, or per fire, model, snapshot and hour when hourly (rows with an error message for fires that couldn't be scored)
+    """
+    from perimeter_catalogue import build_catalogue
+    if fire_numbers is None:
+        fire_numbers = sorted(load_lookup_table()['NUMBER'].dropna().unique())
+    # bring the perimeter catalogue and simulation index up to date once here rather than in every worker
+    build_catalogue(perimeters_path, perimeter_catalogue_path)
+    get_simulation_index()
+    tasks = [(fire_number, simulation_duration, hourly) for fire_number in fire_numbers]
+
+    if workers <= 1:
+        results = list(map(_score_fire_task, tasks))
+    else:
+        # workers start with a clean recorder, their load/overlay totals come back with each fire
+        instrumentation = get_instrumentation()
+        with ProcessPoolExecutor(max_workers=workers, initializer=instrumentation.reset_worker,
+                                 initargs=(instrumentation.current_path(),)) as pool:
+            results = []
+            for rows, totals in pool.map(_score_fire_worker, tasks):
+                instrumentation.merge(totals)
+                results.append(rows)
+
+    columns = ['fire_number', 'model', 'simulation_time', 'simulation_hour', 'perimeter_time',
+               'area_intersection', 'area_only_predicted', 'area_only_observed',
+               'bias', 'hit_rate', 'false_alarm_ratio', 'critical_success_index', 'error']
+    if hourly:
+        columns[4:4] = ['time']
+        columns[-1:-1] = ['hotspots', 'hotspot_share_inside']
+    metrics = pd.DataFrame([row for rows in results for row in rows], columns=columns)
+    failed = metrics.loc[metrics['error'].notna(), 'fire_number'].unique().tolist()
+    print(f'Scored {len(fire_numbers) - len(failed)} of {len(fire_numbers)} fires')
+    if failed:
+        print('Could not score: ' + ', '.join(failed))
+    if out_path:
+        with get_instrumentation().stage('write', rows=len(metrics)):
+            metrics.to_csv(out_path, index=False)
+        print(f'Metrics saved to {out_path}')
+    return metrics
+
+
 if __name__ == "__main__":
 
     args = [arg for arg in sys.argv if arg != '..']
-    fire_number = args[1] 
+    parser = argparse.ArgumentParser(description='Compare FireCast and Technosylva simulations to observed perimeters.')
+    parser.add_argument('fire_numbers', nargs='*', help='fire number(s), e.g. K52125')
+    parser.add_argument('--batch', action='store_true',
+                        help='score every fire given (or every fire in the lookup table) headless, into one metrics table')
+    parser.add_argument('--workers', type=int, default=4, help='processes used in batch mode')
+    parser.add_argument('--out', default=validation_output_path, help='metrics csv written in batch mode')
+    parser.add_argument('--hours', action='store_true',
+                        help='score every simulation hour against every observed perimeter (CSI/bias curves over time)')
+    parser.add_argument('--metrics', help='append per stage timings (JSON lines) to this file')
+    parser.add_argument('--metrics-port', type=int, help='serve the stage timings in Prometheus text format on this port')
+    options = parser.parse_args(args[1:])
+    instrumentation = get_instrumentation()
+    instrumentation.configure(options.metrics, options.metrics_port)
+
+    if options.batch:
+        validate_season(options.fire_numbers or None, options.workers, options.out, hourly=options.hours)
+        if options.metrics or options.metrics_port:
+            print(instrumentation.summary())
+        sys.exit(0)
+    if len(options.fire_numbers) != 1:
+        parser.error('give one fire number, or use --batch')
+    fire_number = options.fire_numbers[0]
+
+    # the single fire comparison pops up a window
+    import matplotlib
+    matplotlib.use('Qt5Agg')
+
+    if options.hours:
+        curves = score_fire_hours(fire_number)
+        print(curves.to_string())
+        plot_skill_curves(curves)
+        sys.exit(0)
     
     #Load data for selected fire
     technosylva, timestamp_ts, latest_hour = load_technosylva(fire_number)
@@ -0,0 +1,179 @@
+'''
+FIRMS/VIIRS hotspot store shared by compare.py and model.py.
+
+The hotspot archive is read and reprojected once, then held as plain numpy arrays: projected x/y and the acquisition
+time as epoch seconds (ACQ_DATE + ACQ_TIME, parsed for the whole column at once). Points are bucketed into a square
+grid (sorted by cell), so a bbox + time window query only looks at the points in the grid rows it overlaps.
+
+The arrays are also saved beside the archive (<archive>.hotspots_<epsg>.npz) and reused while the archive is unchanged,
+so later runs don't read the shapefile at all. Geopandas is only imported to read the archive or build a geodataframe,
+a store loaded from the .npz needs numpy and shapely only.
+
+Dependencies: Geopandas, Numpy, Pandas, Shapely
+Sample use:
+    store = load_hotspots("../data/2023_firms/fire_archive_SV-C2_493123.shp")
+    idx = store.query(bbox=(minx, miny, maxx, maxy), start=datetime(2023, 8, 15), end=datetime(2023, 8, 16))
+    store.points(idx)
+'''
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def epoch_seconds(value):
+    # datetime/Timestamp/string to seconds since 1970 (timezone aware values are taken in UTC)
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+    return int(value.to_datetime64().astype('datetime64[s]').astype(np.int64))
+
+
+def acquisition_times(acq_date, acq_time):
+    """
+    Acquisition times of FIRMS records as epoch seconds.
+
+    Inputs:
+    - acq_date: ACQ_DATE column (dates or date strings)
+    - acq_time: ACQ_TIME column, HHMM (string or number)
+
+    Outputs:
+    - int64 numpy array
+    """
+    days = pd.to_datetime(pd.Series(acq_date)).dt.normalize().to_numpy().astype('datetime64[s]').astype(np.int64)
+    hhmm = pd.to_numeric(pd.Series(acq_time).astype(str).str.strip(), errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    return days + (hhmm // 100) * 3600 + (hhmm % 100) * 60
+
+
+class HotspotStore:
+    """
+    Hotspots as columnar arrays with a grid index.
+
+    Parameters:
+    - x, y: projected coordinates
+    - times: acquisition times, epoch seconds
+    - crs: CRS of x/y
+    - cell_size: grid cell size in CRS units
+    """
+
+    def __init__(self, x, y, times, crs="EPSG:3005", cell_size=10000):
+        self.crs = crs
+        self.cell_size = cell_size
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        times = np.asarray(times, dtype=np.int64)
+        if len(x):
+            self.x0, self.y0 = x.min(), y.min()
+            self.ncx = int((x.max() - self.x0) // cell_size) + 1
+            self.ncy = int((y.max() - self.y0) // cell_size) + 1
+        else:
+            self.x0 = self.y0 = 0.0
+            self.ncx = self.ncy = 1
+        cells = self._cells(x, y)
+        # points sorted by grid cell (row major), then time. one grid row is one contiguous slice
+        order = np.lexsort((times, cells))
+        self.x, self.y, self.times = x[order], y[order], times[order]
+        self.offsets = np.searchsorted(cells[order], np.arange(self.ncx * self.ncy + 1))
+
+    @classmethod
+    def from_file(cls, path, epsg=3005, cell_size=10000, cache=True):
+        """
+        Build a store from a FIRMS archive (shapefile etc. with ACQ_DATE and ACQ_TIME), reprojected to epsg.
+        With cache=True the arrays are kept in <path>.hotspots_<epsg>.npz and reused while the archive is unchanged.
+        """
+        cache_path = f'{path}.hotspots_{epsg}.npz'
+        source_mtime = os.path.getmtime(path)
+        if cache and os.path.exists(cache_path):
+            with np.load(cache_path) as f:
+                if f['source_mtime'] == source_mtime:
+                    return cls(f['x'], f['y'], f['times'], f'EPSG:{epsg}', cell_size)
+
+        import geopandas as gpd
+        firms_gdf = gpd.read_file(path).to_crs(epsg=epsg)
+        x = firms_gdf.geometry.x.to_numpy()
+        y = firms_gdf.geometry.y.to_numpy()
+        times = acquisition_times(firms_gdf['ACQ_DATE'], firms_gdf['ACQ_TIME'])
+        if cache:
+            try:
+                np.savez(cache_path, x=x, y=y, times=times, source_mtime=source_mtime)
+            except OSError as e:
+                print(f'Could not cache hotspots to {cache_path}: {e}')
+        return cls(x, y, times, f'EPSG:{epsg}', cell_size)
+
+    def __len__(self):
+        return len(self.x)
+
+    def _cells(self, x, y):
+        cx = np.clip(((x - self.x0) // self.cell_size).astype(np.int64), 0, self.ncx - 1)
+        cy = np.clip(((y - self.y0) // self.cell_size).astype(np.int64), 0, self.ncy - 1)
+        return cy * self.ncx + cx
+
+    def query(self, bbox=None, start=None, end=None):
+        """
+        Hotspots inside a bounding box and/or time window.
+
+        Inputs:
+        - bbox: (minx, miny, maxx, maxy) in the store's CRS, None for everywhere
+        - start, end: datetimes (inclusive), None for open ended
+
+        Outputs:
+        - indices into the store's arrays (use points() for a geodataframe)
+        """
+        t0 = epoch_seconds(start) if start is not None else np.iinfo(np.int64).min
+        t1 = epoch_seconds(end) if end is not None else np.iinfo(np.int64).max
+        if bbox is None:
+            return np.nonzero((self.times >= t0) & (self.times <= t1))[0]
+
+        minx, miny, maxx, maxy = bbox
+        gx0, gx1 = self._grid_range(minx, maxx, self.x0, self.ncx)
+        gy0, gy1 = self._grid_range(miny, maxy, self.y0, self.ncy)
+        if gx0 > gx1 or gy0 > gy1:
+            return np.array([], dtype=np.int64)
+        found = []
+        for gy in range(gy0, gy1 + 1):
+            lo, hi = self.offsets[gy * self.ncx + gx0], self.offsets[gy * self.ncx + gx1 + 1]
+            x, y, t = self.x[lo:hi], self.y[lo:hi], self.times[lo:hi]
+            keep = (x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy) & (t >= t0) & (t <= t1)
+            found.append(lo + np.nonzero(keep)[0])
+        return np.concatenate(found)
+
+    def _grid_range(self, low, high, origin, count):
+        # first and last grid cell index touched by [low, high], clipped to the grid
+        first = max(int((low - origin) // self.cell_size), 0)
+        last = min(int((high - origin) // self.cell_size), count - 1)
+        return first, last
+
+    def within(self, geometry, start=None, end=None):
+        """
+        Hotspots inside (or on the edge of) a polygon, optionally within a time window.
+
+        Inputs:
+        - geometry: shapely geometry in the store's CRS
+        - start, end: datetimes (inclusive), None for open ended
+
+        Outputs:
+        - indices into the store's arrays
+        """
+        idx = self.query(geometry.bounds, start, end)
+        inside = shapely.intersects_xy(geometry, self.x[idx], self.y[idx])
+        return idx[inside]
+
+    def times_as_datetimes(self, idx):
+        return self.times[idx].astype('datetime64[s]')
+
+    def points(self, idx):
+        """
+        Geodataframe of the hotspots at idx, with their acquisition time in an 'ACQ_DATETIME' column
+        """
+        import geopandas as gpd
+        return gpd.GeoDataFrame({'ACQ_DATETIME': self.times_as_datetimes(idx)},
+                                geometry=gpd.points_from_xy(self.x[idx], self.y[idx]), crs=self.crs)
+
+
+@lru_cache(maxsize=None)
+def load_hotspots(path, epsg=3005):
+    # one store per archive per process
+    return HotspotStore.from_file(path, epsg)
@@ -1,23 +1,14 @@
 import os
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
 import zipfile
+from datetime import timedelta
 
-from shapely.geometry import Polygon, MultiPolygon, Point
-from shapely.ops import unary_union
-import numpy as np
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from scipy.spatial import Delaunay, ConvexHull
-from shapely.geometry import Polygon, MultiPolygon
-from shapely.ops import unary_union
-import numpy as np
-from datetime import datetime, timedelta
-
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Cursor
-from matplotlib.patches import Polygon as pol
+import pandas as pd
+
+from simulation_index import SimulationIndex
+
+# importing this file does no I/O. geopandas, shapely and the hotspot store are only loaded by the functions using them,
+# matplotlib only by the (commented out) plotting below. run it as a script to go through every fire:
+# >>python3 model.py
 
 def extract_kmz(kmz_path, extract_to_folder):
     with zipfile.ZipFile(kmz_path, 'r') as kmz:
@@ -27,29 +18,39 @@ def extract_kmz(kmz_path, extract_to_folder):
     
 
 
-def check_fire_date():
-    simlist = os.listdir("/mnt/d/MODELS/simulations")
+simulations_path = "/mnt/d/MODELS/simulations"
+simulation_index_path = "../shape_files/simulation_index.parquet"
+
+
+def get_simulation_index():
+    # simulation folders come from the index (simulation_index.py), the share is only re-listed where it changed
+    index = SimulationIndex(simulation_index_path, firecast_root=simulations_path)
+    index.refresh()
+    return index
+
+
+def first_simulation(index, fire_num):
+    # earliest simulation run of a fire (the index row), None if the fire has no runs
+    runs = index.query(fire_number=fire_num, vendor='firecast', include_missing=True)
+    runs = runs[runs['start_time'].notna()]
+    if runs.empty:
+        return None
+    return runs.sort_values(['start_time', 'folder'], kind='mergesort').iloc[0]
+
+
+def check_fire_date(index=None):
+    import geopandas as gpd
+    index = index or get_simulation_index()
     fires_gdf = gpd.read_file('../shape_files/prot_current_fire_polys_202310241608.zip')
     fires_gdf = fires_gdf.to_crs(epsg=4326)
-    firms_gdf = gpd.read_file('../shape_files/fire_archive_SV-C2_493123.shp')
-    firms_gdf = firms_gdf.to_crs(epsg=4326)
-    firelist = []
     kept_fires = []
-    for fire in simlist:
-        if len(fire.split('_')[-1]) == 6:
-         firelist.append(fire)
-    for fire in firelist: #firelist:
-        models = os.listdir(f'/mnt/d/MODELS/simulations/{fire}')
-        dates = []
-        for model in models:
-            if len(model.split('_')) == 6:
-                dates.append((int(model.split('_')[5][:8]),model))
-        dates.sort()
-        if len(dates) != 0 and 20230801 <= dates[0][0] <= 20230830:
-            sims = os.listdir(f'/mnt/d/MODELS/simulations/{fire}/{dates[0][1]}')
-            for file in sims:
-                if '.shp' in file:
-                    kept_fires.append(fire.split('_')[-1])
+    for fire in index.query(vendor='firecast', include_missing=True)['fire_number'].unique():
+        if len(fire) != 6:
+            continue
+        first = first_simulation(index, fire)
+        if first is not None and 20230801 <= int(first['start_time'].strftime('%Y%m%d')) <= 20230830:
+            if first['path'] is not None and pd.notna(first['path']):
+                kept_fires.append(fire)
     good_fires = []
     for fire in kept_fires:
         fire_gdf = fires_gdf[fires_gdf['FIRE_NUM'] == fire]
@@ -57,44 +58,37 @@ def check_fire_date():
             good_fires.append(fire)
     return good_fires
     
-def get_buffered_perimeter(fire_num):
+def get_buffered_perimeter(fire_num, index=None):
+    import geopandas as gpd
+    from shapely.ops import unary_union
+    from hotspots import load_hotspots
+    index = index or get_simulation_index()
     fires_gdf = gpd.read_file('../shape_files/prot_current_fire_polys_202310241608.zip')
-    sim_file = f'/mnt/d/MODELS/simulations/BCWS_2023_{fire_num}'
-    first_det = os.listdir(sim_file)[0]
-    if len(first_det.split('_')) == 6:
-        first_date = datetime.strptime(first_det.split("_")[5][:-3], '%Y%m%d%H%M%S')
-    else:
+    first = first_simulation(index, fire_num)
+    if first is None:
         print('Invalid fire')
         return
+    first_date = first['start_time'].to_pydatetime()
     date_range = first_date + timedelta(days=1)
     if fire_num in fires_gdf['FIRE_NUM'].tolist():
-        firms_gdf = gpd.read_file('../shape_files/fire_archive_SV-C2_493123.shp')
-        firms_gdf = firms_gdf.to_crs(epsg=4326)
+        hotspots = load_hotspots('../shape_files/fire_archive_SV-C2_493123.shp')
         fire_gdf = fires_gdf[fires_gdf['FIRE_NUM'] == fire_num]
+        # hotspots inside the fire perimeter during the first day of the simulation, one indexed query
+        fire_shape = unary_union(fire_gdf.to_crs(hotspots.crs).geometry.values)
+        perim_point_gdf = hotspots.points(hotspots.within(fire_shape, first_date, date_range)).to_crs(epsg=4326)
         fire_gdf = fire_gdf.to_crs(epsg=4326)
-        firms_trim = gpd.sjoin(firms_gdf, fire_gdf,how='inner',predicate='intersects')
-        firms_list = [(point.x,point.y) for point in firms_trim.geometry]
-        firms_dates = [date for date in firms_trim.ACQ_DATE]
-        firms_times = [time for time in firms_trim.ACQ_TIME]
-        firms_dt = [datetime.strptime(f'{str(firms_dates[i])[:10]}-{firms_times[i]}','%Y-%m-%d-%H%M') for i in range(len(firms_dates))]
-        firms_perim = []
-        firms_point = []
-        for point in range(len(firms_list)):
-            if first_date <= firms_dt[point] <= date_range:
-                firms_perim.append(firms_list[point])
-                firms_point.append(Point(firms_list[point]))
-        perim_point_gdf = gpd.GeoDataFrame({'geometry':firms_point}, crs='EPSG:4326')
-
-        files = os.listdir(f'{sim_file}/{first_det}')
-        for file in files:
-            if '.shp' in file:
-                shape_file = file
-                break
-        perim_sim = gpd.read_file(f'{sim_file}/{first_det}/{shape_file}')
+        firms_perim = list(zip(perim_point_gdf.geometry.x, perim_point_gdf.geometry.y))
+
+        perim_sim = gpd.read_file(first['path'])
         perim_sim = perim_sim.to_crs(epsg=4326)
 
         '''
         #Method for manually cutting a fire perimeter from VIIRS data:
+        # import numpy as np
+        # import matplotlib.pyplot as plt
+        # from matplotlib.widgets import Cursor
+        # from matplotlib.patches import Polygon as pol
+        # from shapely.geometry import Polygon
         # x = []
         # y = []
         # for point in firms_perim:
@@ -153,6 +147,7 @@ def get_buffered_perimeter(fire_num):
         # poly = Polygon(points)
         # perimeter_gdf = gpd.GeoDataFrame(geometry=[poly], crs='EPSG:4326')
         if perim_sim.shape[0] != 0:
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots()
             perim_sim.plot(ax=ax,color='blue')
             fire_gdf.plot(ax=ax, facecolor='none')
@@ -166,6 +161,8 @@ def get_buffered_perimeter(fire_num):
     else:
         print('Fire not in perimeters')
 
-fires = check_fire_date()
-for fire in fires:
-    get_buffered_perimeter(fire)
\ No newline at end of file
+if __name__ == "__main__":
+    index = get_simulation_index()
+    fires = check_fire_date(index)
+    for fire in fires:
+        get_buffered_perimeter(fire, index)
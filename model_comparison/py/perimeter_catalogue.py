@@ -0,0 +1,152 @@
+'''
+Perimeter catalogue: every prot_current_fire_polys_YYYYMMDDHHMM snapshot folder read once and stored in one
+GeoParquet file, keyed by (FIRE_NUMBER, SNAPSHOT_TIME), geometries already projected to EPSG:3005.
+
+Rows are sorted by fire number then snapshot time and written in small row groups, so a query for one fire only
+reads the row groups holding that fire (parquet min/max statistics). A bbox covering column is written as well,
+so spatial queries only read the row groups overlapping the box.
+
+Rebuilding is incremental, only snapshot folders that aren't in the catalogue yet are read.
+
+Dependencies: Geopandas, Pandas, Pyarrow
+Build (or bring up to date) the catalogue for compare.py:
+>>python3 perimeter_catalogue.py
+'''
+
+import os
+import sys
+from datetime import datetime
+
+import geopandas as gpd
+import pandas as pd
+
+
+row_group_size = 2000
+
+
+def snapshot_folders(perimeters_path):
+    """
+    Snapshot folders under perimeters_path, oldest first.
+
+    Inputs:
+    - perimeters_path: folder holding the prot_current_fire_polys_YYYYMMDDHHMM folders
+
+    Outputs:
+    - list of (snapshot datetime, folder path)
+    """
+    folders = []
+    for folder in os.listdir(perimeters_path):
+        folder_path = os.path.join(perimeters_path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        try:
+            folder_date = datetime.strptime(folder.split('_')[-1], '%Y%m%d%H%M')
+        except ValueError:
+            continue
+        folders.append((folder_date, folder_path))
+    return sorted(folders)
+
+
+def read_snapshot(folder_path, snapshot_time):
+    # one snapshot as catalogue rows: FIRE_NUMBER, SNAPSHOT_TIME, geometry (EPSG:3005)
+    perimeters = gpd.read_file(folder_path).to_crs(epsg=3005)
+    # Check if either 'FIRE_NUMBE' or 'FIRE_NUM' exists in the GeoDataFrame
+    fire_column = 'FIRE_NUMBE' if 'FIRE_NUMBE' in perimeters.columns else 'FIRE_NUM'
+    return gpd.GeoDataFrame({
+        'FIRE_NUMBER': perimeters[fire_column].astype(str).values,
+        'SNAPSHOT_TIME': pd.Timestamp(snapshot_time)
+    }, geometry=perimeters.geometry.values, crs=perimeters.crs)
+
+
+def build_catalogue(perimeters_path, catalogue_path, rebuild=False):
+    """
+    Create the catalogue, or add any snapshot folders that are newer than it.
+
+    Inputs:
+    - perimeters_path: folder holding the prot_current_fire_polys_YYYYMMDDHHMM folders
+    - catalogue_path: GeoParquet file to write
+    - rebuild: Bool value of whether to read every snapshot again instead of only the new ones
+
+    Outputs:
+    - number of snapshot folders added
+    """
+    existing = None
+    done = set()
+    if os.path.exists(catalogue_path) and not rebuild:
+        existing = gpd.read_parquet(catalogue_path)
+        done = set(existing['SNAPSHOT_TIME'].unique())
+
+    frames = [] if existing is None else [existing]
+    added = 0
+    for snapshot_time, folder_path in snapshot_folders(perimeters_path):
+        if pd.Timestamp(snapshot_time) in done:
+            continue
+        try:
+            frames.append(read_snapshot(folder_path, snapshot_time))
+            added += 1
+        except Exception as e:
+            print(f"Error processing folder '{folder_path}': {e}")
+
+    if added == 0:
+        print('Perimeter catalogue is up to date')
+        return 0
+    catalogue = pd.concat(frames, ignore_index=True)
+    catalogue = catalogue.sort_values(['FIRE_NUMBER', 'SNAPSHOT_TIME'], kind='mergesort', ignore_index=True)
+
+    # written next to the old file and swapped in, a failed build never leaves half a catalogue
+    tmp_path = catalogue_path + '.tmp'
+    catalogue.to_parquet(tmp_path, index=False, write_covering_bbox=True, row_group_size=row_group_size)
+    os.replace(tmp_path, catalogue_path)
+    print(f'Added {added} snapshot(s) to perimeter catalogue {catalogue_path} ({len(catalogue)} perimeters)')
+    return added
+
+
+def read_catalogue(catalogue_path, fire_number=None, after=None, before=None, bbox=None):
+    """
+    Perimeters from the catalogue, only reading the parts of the file that can match.
+
+    Inputs:
+    - catalogue_path: GeoParquet file made by build_catalogue
+    - fire_number: Alphanumeric fire number (as per BCWS categorization system), None for every fire
+    - after: only snapshots strictly after this datetime
+    - before: only snapshots at or before this datetime
+    - bbox: (minx, miny, maxx, maxy) in EPSG:3005, only perimeters whose bounding box overlaps it
+
+    Outputs:
+    - geodataframe with FIRE_NUMBER, SNAPSHOT_TIME and geometry, sorted by fire number and snapshot time
+    """
+    filters = []
+    if fire_number is not None:
+        filters.append(('FIRE_NUMBER', '==', str(fire_number)))
+    if after is not None:
+        filters.append(('SNAPSHOT_TIME', '>', pd.Timestamp(after)))
+    if before is not None:
+        filters.append(('SNAPSHOT_TIME', '<=', pd.Timestamp(before)))
+    return gpd.read_parquet(catalogue_path, bbox=bbox, filters=filters or None)
+
+
+def first_perimeter_after(catalogue_path, fire_number, after):
+    """
+    Perimeter of a fire in the earliest snapshot taken after a given time.
+
+    Inputs:
+    - catalogue_path: GeoParquet file made by build_catalogue
+    - fire_number: Alphanumeric fire number (as per BCWS categorization system)
+    - after: datetime, the snapshot has to be strictly later than this
+
+    Outputs:
+    - geodataframe with the fire's polygon(s) in that snapshot
+    - datetime of the snapshot
+    """
+    perimeters = read_catalogue(catalogue_path, fire_number=fire_number, after=after)
+    if perimeters.empty:
+        raise ValueError(f"No polygon found for fire number {fire_number} in any snapshot after {after}.")
+    snapshot_time = perimeters['SNAPSHOT_TIME'].min()
+    return perimeters[perimeters['SNAPSHOT_TIME'] == snapshot_time], snapshot_time.to_pydatetime()
+
+
+if __name__ == "__main__":
+    import compare
+
+    args = [arg for arg in sys.argv if arg != '..']
+    build_catalogue(compare.perimeters_path, compare.perimeter_catalogue_path, rebuild='--rebuild' in args)
@@ -1,49 +1,34 @@
 import geopandas as gpd
 import rasterio
 import rasterio.features
+import rasterio.windows
 import numpy as np
 from rasterio.transform import from_origin
-from shapely.geometry import mapping
-import matplotlib.pyplot as plt
-import matplotlib.colors
+from rasterio.windows import Window
+from shapely.geometry import box, mapping
 
-def shapefile_to_raster(shape_files, to_tif=False, pixel_size=1):
+def load_shapes(shape_files):
+    # shape file path(s) to a list of geodataframes in EPSG:3005
+    if type(shape_files) != list:
+        shape_files = [shape_files]
+    return [gpd.read_file(file).to_crs(epsg=3005) for file in shape_files]
+
+
+def shared_grid(gdfs, pixel_size=1):
     """
-    Convert a shapefile(s) to a raster file.
+    Grid covering every geodataframe, used so all shapes are rasterized onto the same pixels.
 
     Parameters:
-    - shape_files (list or str) of paths to the input shapefiles.
-    - to_tif (bool) writes raster to a tif file if True
-    - pixel_size (int): Size of each pixel in the output raster (in the same units as the shapefile's CRS).
+    - gdfs (list) of geodataframes in EPSG:3005
+    - pixel_size (int): Size of each pixel (in the same units as the CRS)
 
+    Returns:
+    - transform, width, height
     """
-    #changes single file to list if called on a single file
-    if type(shape_files) != list:
-        shape_files = [shape_files]
-
-    #defining max and min cord arrays
-    maxxs = []
-    maxys = []
-    minxs = []
-    minys = []
-    gdfs = []
-    
     #searching for largest square in shape_files
-    for file in shape_files:
-        gdf = gpd.read_file(file).to_crs(epsg=3005)
-        bounds = gdf.total_bounds
-        minx, miny, maxx, maxy = bounds
-        minxs.append(minx)
-        minys.append(miny)
-        maxxs.append(maxx)
-        maxys.append(maxy)
-        gdfs.append(gdf)
-    
-    #defining max x, y and min x, y
-    maxx = max(maxxs)
-    maxy = max(maxys)
-    minx = min(minxs)
-    miny = min(minys)
+    bounds = np.array([gdf.total_bounds for gdf in gdfs])
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    maxx, maxy = bounds[:, 2].max(), bounds[:, 3].max()
 
     #defining width/height
     width = int((maxx - minx) / pixel_size)
@@ -51,29 +36,130 @@ def shapefile_to_raster(shape_files, to_tif=False, pixel_size=1):
 
     #defining transform
     transform = from_origin(minx, maxy, pixel_size, pixel_size)
+    return transform, width, height
+
+
+def rasterize_window(gdfs, transform, window, out=None):
+    """
+    Burn each geodataframe into a uint8 mask (1 inside, 0 outside) for one window of the shared grid.
+    Only the geometries whose bounding box touches the window are rasterized.
+
+    Parameters:
+    - gdfs (list) of geodataframes in EPSG:3005
+    - transform: transform of the full grid (from shared_grid)
+    - window (rasterio.windows.Window): part of the grid to rasterize
+    - out (np.ndarray, optional): uint8 buffer of shape (len(gdfs), window.height, window.width) to write into,
+      lets the same buffer be reused for every tile
+
+    Returns:
+    - uint8 array of shape (len(gdfs), window.height, window.width)
+    """
+    shape = (len(gdfs), int(window.height), int(window.width))
+    if out is None:
+        out = np.zeros(shape, dtype=np.uint8)
+    else:
+        out = out[:, :shape[1], :shape[2]]
+        out[:] = 0
+    window_transform = rasterio.windows.transform(window, transform)
+    window_box = box(*rasterio.windows.bounds(window, transform))
+    for band, gdf in zip(out, gdfs):
+        geoms = gdf.geometry.values[gdf.sindex.query(window_box)]
+        if len(geoms):
+            rasterio.features.rasterize([(mapping(geom), 1) for geom in geoms],
+                                        out=band, transform=window_transform)
+    return out
+
+
+def iter_raster_tiles(gdfs, pixel_size=1, tile_size=2048):
+    """
+    Rasterize shapes tile by tile on their shared grid, memory stays at one tile whatever the size of the fire.
+
+    Parameters:
+    - gdfs (list) of geodataframes in EPSG:3005 (see load_shapes)
+    - pixel_size (int): Size of each pixel (in the same units as the CRS)
+    - tile_size (int): tile width/height in pixels
+
+    Yields:
+    - (window, masks): rasterio window and a uint8 array (len(gdfs), rows, cols). The array is a reused buffer,
+      copy it if it has to outlive the next tile
+    """
+    transform, width, height = shared_grid(gdfs, pixel_size)
+    buffer = np.zeros((len(gdfs), min(tile_size, height), min(tile_size, width)), dtype=np.uint8)
+    for row_off in range(0, height, tile_size):
+        for col_off in range(0, width, tile_size):
+            window = Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+            yield window, rasterize_window(gdfs, transform, window, out=buffer)
+
+
+def shapefile_to_tiled_tif(shape_files, out_path, pixel_size=1, tile_size=2048):
+    """
+    Rasterize shapefile(s) straight into a tiled, compressed GeoTIFF (one band per shapefile, stored as 1 bit masks),
+    streaming one tile at a time so fine resolutions over large fires fit in a fixed amount of memory.
+
+    Parameters:
+    - shape_files (list or str) of paths to the input shapefiles.
+    - out_path (str): GeoTIFF to write
+    - pixel_size (int): Size of each pixel in the output raster (in the same units as the shapefile's CRS).
+    - tile_size (int): tile width/height in pixels (multiple of 16)
+    """
+    gdfs = load_shapes(shape_files)
+    transform, width, height = shared_grid(gdfs, pixel_size)
+    metadata = {
+        'driver': 'GTiff',
+        'count': len(gdfs),
+        'dtype': 'uint8',
+        'nbits': 1,
+        'width': width,
+        'height': height,
+        'crs': 'EPSG:3005',
+        'transform': transform,
+        'tiled': True,
+        'blockxsize': min(tile_size, 512),
+        'blockysize': min(tile_size, 512),
+        'compress': 'deflate',
+        'BIGTIFF': 'IF_SAFER'
+    }
+    with rasterio.open(out_path, 'w', **metadata) as dst:
+        for window, masks in iter_raster_tiles(gdfs, pixel_size, tile_size):
+            dst.write(masks, window=window)
+    return out_path
+
+
+def shapefile_to_raster(shape_files, to_tif=False, pixel_size=1, dtype='float32'):
+    """
+    Convert a shapefile(s) to a raster file.
+
+    Parameters:
+    - shape_files (list or str) of paths to the input shapefiles.
+    - to_tif (bool) writes raster to a tif file if True
+    - pixel_size (int): Size of each pixel in the output raster (in the same units as the shapefile's CRS).
+    - dtype (str): array type, 'uint8' takes a quarter of the memory of the default float32.
+      For very large grids use iter_raster_tiles or shapefile_to_tiled_tif instead.
+
+    """
+    gdfs = load_shapes(shape_files)
+    transform, width, height = shared_grid(gdfs, pixel_size)
 
     #defining metadata for tif
     metadata = {
         'driver': 'GTiff',
         'count': 1,
-        'dtype': 'float32',
+        'dtype': dtype,
         'width': width,
         'height': height,
         'crs': 'EPSG:3005',
         'transform': transform
     }
 
-    #creatiing list of arrays, one for each shape file
+    #creatiing list of arrays, one for each shape file, burned straight into the preallocated array
     array_list = []
     i = 0
     for gdf in gdfs:
-        raster_array = np.zeros((height, width), dtype=np.float32)
-        raster_array += rasterio.features.rasterize(
+        raster_array = np.zeros((height, width), dtype=dtype)
+        rasterio.features.rasterize(
             [(mapping(geom), 1) for geom in gdf.geometry],
-            out_shape=raster_array.shape,
-            transform=transform,
-            fill=0,
-            dtype='float32'
+            out=raster_array,
+            transform=transform
         )
         array_list.append(raster_array)
         #saving to a tif if called
@@ -84,41 +170,133 @@ def shapefile_to_raster(shape_files, to_tif=False, pixel_size=1):
 
     return array_list
 
-def confusion(shape_files):
+class ConfusionMetrics:
+    """
+    Pixel counts of a simulation mask against an observed mask, with the percentages and skill scores derived from them.
+    Counts from separate tiles can be added together (metrics_a + metrics_b).
+
+    Parameters:
+    - tt: simulated burned, observed burned (correct burned area)
+    - tf: simulated burned, observed unburned (false positives)
+    - ft: simulated unburned, observed burned (missed burned area)
+    - ff: simulated unburned, observed unburned (correct unburned area)
+    """
+
+    def __init__(self, tt=0, tf=0, ft=0, ff=0):
+        self.tt, self.tf, self.ft, self.ff = int(tt), int(tf), int(ft), int(ff)
+
+    def __add__(self, other):
+        return ConfusionMetrics(self.tt + other.tt, self.tf + other.tf, self.ft + other.ft, self.ff + other.ff)
+
+    def __repr__(self):
+        return f'ConfusionMetrics(tt={self.tt}, tf={self.tf}, ft={self.ft}, ff={self.ff})'
+
+    @property
+    def size(self):
+        return self.tt + self.tf + self.ft + self.ff
+
+    def percent(self, count):
+        return round(100*count/self.size, 1) if self.size else float('nan')
+
+    @property
+    def bias(self):
+        return (self.tt + self.tf)/(self.tt + self.ft) if self.tt + self.ft else float('nan')
+
+    @property
+    def hit_rate(self):
+        return self.tt/(self.tt + self.ft) if self.tt + self.ft else float('nan')
+
+    @property
+    def false_alarm_ratio(self):
+        return 1 - self.tt/(self.tt + self.tf) if self.tt + self.tf else float('nan')
+
+    @property
+    def critical_success_index(self):
+        hits_and_misses = self.tt + self.tf + self.ft
+        return self.tt/hits_and_misses if hits_and_misses else float('nan')
+
+    def as_dict(self):
+        return {'tt': self.tt, 'tf': self.tf, 'ft': self.ft, 'ff': self.ff,
+                'tt_per': self.percent(self.tt), 'tf_per': self.percent(self.tf),
+                'ft_per': self.percent(self.ft), 'ff_per': self.percent(self.ff),
+                'bias': self.bias, 'hit_rate': self.hit_rate, 'false_alarm_ratio': self.false_alarm_ratio,
+                'critical_success_index': self.critical_success_index}
+
+
+def confusion_codes(simulated, observed):
+    # one uint8 array: 3 = both burned, 2 = simulated only, 1 = observed only, 0 = neither
+    codes = (np.asarray(simulated) != 0).view(np.uint8) << 1
+    codes |= (np.asarray(observed) != 0).view(np.uint8)
+    return codes
+
+
+def confusion_counts(simulated, observed):
+    """
+    Confusion counts of two masks in a single pass (each pixel pair encoded as 2*sim + obs, then counted with bincount).
+
+    Parameters:
+    - simulated, observed: arrays of the same shape, nonzero = burned
+
+    Returns:
+    - ConfusionMetrics
+    """
+    ff, ft, tf, tt = np.bincount(confusion_codes(simulated, observed).ravel(), minlength=4)
+    return ConfusionMetrics(tt, tf, ft, ff)
+
+
+def confusion(shape_files, pixel_size=1, tile_size=None, plot=True, block=True, save_path=None):
     '''
     Plots the confusion matrix for the shape files provided
 
     Parameters:
-    - shape files (list), list of two shape files
+    - shape files (list), list of two shape files (simulation first, observed second)
+    - pixel_size (int): Size of each pixel (in the same units as the CRS)
+    - tile_size (int, optional): count tile by tile in fixed memory (see iter_raster_tiles), nothing is plotted
+    - plot (bool): plot the confusion map
+    - block (bool): wait for the plot window to be closed, False returns straight away
+    - save_path (str, optional): save the plot to this file instead of showing it (for batch jobs)
+
+    Returns:
+    - ConfusionMetrics
     '''
-    #converting shapefiles to arrays
-    data = shapefile_to_raster(shape_files)
+    if tile_size:
+        #counting tile by tile, the full rasters never exist
+        metrics = ConfusionMetrics()
+        for window, masks in iter_raster_tiles(load_shapes(shape_files), pixel_size, tile_size):
+            metrics += confusion_counts(masks[0], masks[1])
+        return metrics
 
-    #calculating lodgic arrays
-    TT = np.logical_and(data[0]==1,data[1]==1)
-    TF = np.logical_and(data[0]==1,data[1]==0)
-    FT= np.logical_and(data[0]==0,data[1]==1)
-    FF = np.logical_and(data[0]==0,data[1]==0)
+    #converting shapefiles to arrays
+    data = shapefile_to_raster(shape_files, pixel_size=pixel_size, dtype='uint8')
 
-    #calculating plotting array
-    plotter = 3*TT + 2*TF + FT
+    #category of every pixel, doubles as the plotting array
+    plotter = confusion_codes(data[0], data[1])
+    ff, ft, tf, tt = np.bincount(plotter.ravel(), minlength=4)
+    metrics = ConfusionMetrics(tt, tf, ft, ff)
 
     #calculating percents of each catagory
-    size = TT.shape[0]*TT.shape[1]
-    tt_per = round(100*np.sum(TT)/size, 1)
-    tf_per = round(100*np.sum(TF)/size, 1)
-    ft_per = round(100*np.sum(FT)/size, 1)
-    ff_per = round(100*np.sum(FF)/size, 1)
+    tt_per = metrics.percent(metrics.tt)
+    tf_per = metrics.percent(metrics.tf)
+    ft_per = metrics.percent(metrics.ft)
+    ff_per = metrics.percent(metrics.ff)
 
     #plotting
-    plt.figure(figsize=(15,15))
-    cmap = matplotlib.colors.ListedColormap(['green','yellow','orange','red'])
-    plt.imshow(plotter, cmap=cmap,vmin=0,vmax=3)
-    plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim correct unburned area: {ff_per}%',color='green')
-    plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim missed burned area: {ft_per}%' ,color='yellow')
-    plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim false positives: {tf_per}%',color='orange')
-    plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim correct burned area: {tt_per}%',color='red')
-    plt.legend(fontsize="12")
-    plt.show()
+    if plot:
+        import matplotlib.pyplot as plt
+        import matplotlib.colors
+        plt.figure(figsize=(15,15))
+        cmap = matplotlib.colors.ListedColormap(['green','yellow','orange','red'])
+        plt.imshow(plotter, cmap=cmap,vmin=0,vmax=3)
+        plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim correct unburned area: {ff_per}%',color='green')
+        plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim missed burned area: {ft_per}%' ,color='yellow')
+        plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim false positives: {tf_per}%',color='orange')
+        plt.scatter(np.nan,np.nan,marker='s',s=100,label=f'Sim correct burned area: {tt_per}%',color='red')
+        plt.legend(fontsize="12")
+        if save_path:
+            plt.savefig(save_path)
+            plt.close()
+        else:
+            plt.show(block=block)
     print(f'Model correct: {tt_per+ff_per}%')
-    print(f'Model incorect: {tf_per+ft_per}%')
\ No newline at end of file
+    print(f'Model incorect: {tf_per+ft_per}%')
+    return metrics
@@ -0,0 +1,263 @@
+'''
+Index of FireCast and Technosylva simulation outputs.
+
+The simulation stores are crawled once and every simulation is recorded as one row:
+(vendor, season, fire number, start time, end time, duration, output file, CRS, bounds). The index is saved as a parquet
+file next to the data, so later lookups are a query on a small table instead of walking the network share again.
+
+Refreshing is incremental. Folder modification times are stored with every row, a folder is only listed again when
+its mtime has changed (a new run folder changes the fire folder's mtime, new output changes the run folder's mtime).
+Technosylva rows come from the Excel lookup table, which is only re-read when the file itself changes.
+
+Expected layouts:
+- FireCast:    <firecast_root>/BCWS_2023_K52125/<run folder ending _YYYYMMDDHHMMSS...>/<name>_YYYYMMDDHHMMSS_<...>.shp
+- Technosylva: <technosylva_root>/<Sim_unique>/Perimeters.geojson, described by the lookup table
+               (NUMBER, Sim_unique, FORECAST_TIMESTAMP, DURATION_HOURS)
+
+Dependencies: Pandas, Fiona, Pyarrow
+Sample use:
+    index = SimulationIndex("../data/2023_simulation_index.parquet", firecast_root, technosylva_root, lookup_table_path)
+    index.refresh()
+    index.query(fire_number="K52125", vendor="firecast")
+'''
+
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+
+index_columns = ['vendor', 'season', 'fire_number', 'sim_id', 'start_time', 'end_time', 'duration_hours', 'path',
+                 'crs', 'minx', 'miny', 'maxx', 'maxy', 'folder', 'folder_mtime', 'parent', 'parent_mtime']
+
+fire_folder_pattern = re.compile(r'^BCWS_(\d{4})_(\w+)$')
+run_time_pattern = re.compile(r'_(\d{8})(\d{6})')
+output_time_pattern = re.compile(r'_(\d{8}\d{6})_')
+
+
+def file_extent(path):
+    # CRS and bounds of a vector file from its header, without loading the features
+    import fiona
+    try:
+        with fiona.open(path) as src:
+            crs = src.crs.to_string() if src.crs else None
+            minx, miny, maxx, maxy = src.bounds
+        return crs, minx, miny, maxx, maxy
+    except Exception as e:
+        print(f"Could not read extent of '{path}': {e}")
+        return None, None, None, None, None
+
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class SimulationIndex:
+    """
+    Persistent index of simulation outputs for one or both vendors.
+
+    Parameters:
+    - index_path: parquet file the index is kept in
+    - firecast_root: folder holding the BCWS_<year>_<fire> FireCast folders, None to skip FireCast
+    - technosylva_root: folder holding the Technosylva Sim_unique folders, None to skip Technosylva
+    - lookup_table_path: Technosylva Excel lookup table
+    """
+
+    def __init__(self, index_path, firecast_root=None, technosylva_root=None, lookup_table_path=None):
+        self.index_path = index_path
+        self.firecast_root = firecast_root
+        self.technosylva_root = technosylva_root
+        self.lookup_table_path = lookup_table_path
+        if os.path.exists(index_path):
+            self.table = pd.read_parquet(index_path)
+        else:
+            self.table = pd.DataFrame(columns=index_columns)
+
+    def refresh(self, rebuild=False):
+        """
+        Bring the index up to date with the simulation stores and save it if anything changed.
+
+        Inputs:
+        - rebuild: Bool value of whether to crawl everything again, ignoring the stored mtimes
+
+        Outputs:
+        - number of folders that were (re)scanned
+        """
+        old = self.table.iloc[0:0] if rebuild else self.table
+        frames = []
+        scanned = 0
+        if self.firecast_root:
+            rows, n = self._refresh_firecast(old[old['vendor'] == 'firecast'])
+            frames.append(rows)
+            scanned += n
+        else:
+            frames.append(old[old['vendor'] == 'firecast'])
+        if self.technosylva_root and self.lookup_table_path:
+            rows, n = self._refresh_technosylva(old[old['vendor'] == 'technosylva'])
+            frames.append(rows)
+            scanned += n
+        else:
+            frames.append(old[old['vendor'] == 'technosylva'])
+
+        frames = [frame for frame in frames if not frame.empty]
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=index_columns)
+        table = table[index_columns].sort_values(['vendor', 'fire_number', 'folder'], kind='mergesort', ignore_index=True)
+        # rows are built from dicts with None gaps, give every column one type so the parquet schema stays stable
+        for column in ('start_time', 'end_time'):
+            table[column] = pd.to_datetime(table[column])
+        for column in ('season', 'duration_hours', 'minx', 'miny', 'maxx', 'maxy', 'folder_mtime', 'parent_mtime'):
+            table[column] = pd.to_numeric(table[column])
+        if scanned or rebuild or len(table) != len(self.table):
+            self.table = table
+            self.save()
+            print(f'Simulation index updated, {scanned} folder(s) scanned, {table["path"].notna().sum()} simulations')
+        return scanned
+
+    def save(self):
+        # written beside the old file then swapped in, so readers never see a partial index
+        folder = os.path.dirname(os.path.abspath(self.index_path))
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        self.table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.index_path)
+
+    def query(self, fire_number=None, vendor=None, season=None, min_duration=None, include_missing=False):
+        """
+        Simulations from the index.
+
+        Inputs:
+        - fire_number: Alphanumeric fire number (as per BCWS categorization system), None for every fire
+        - vendor: 'firecast' or 'technosylva', None for both
+        - season: fire season (year), None for every season
+        - min_duration: only simulations at least this many hours long
+        - include_missing: Bool value of whether run folders without an output file are included (path is None)
+
+        Outputs:
+        - dataframe of index rows
+        """
+        table = self.table
+        mask = pd.Series(True, index=table.index)
+        if fire_number is not None:
+            mask &= table['fire_number'] == str(fire_number)
+        if vendor is not None:
+            mask &= table['vendor'] == vendor
+        if season is not None:
+            mask &= table['season'] == season
+        if min_duration is not None:
+            mask &= table['duration_hours'] >= min_duration
+        if not include_missing:
+            mask &= table['path'].notna()
+        return table[mask]
+
+    def technosylva_lookup(self, season=None):
+        """
+        Technosylva rows in the shape of the Excel lookup table (NUMBER, Sim_unique, FORECAST_TIMESTAMP,
+        DURATION_HOURS), plus the path of the output file.
+        """
+        rows = self.query(vendor='technosylva', season=season, include_missing=True)
+        return rows.rename(columns={'fire_number': 'NUMBER', 'sim_id': 'Sim_unique',
+                                    'start_time': 'FORECAST_TIMESTAMP', 'duration_hours': 'DURATION_HOURS'})
+
+    def closest_firecast(self, fire_number, target_date, season=None):
+        """
+        FireCast run of a fire whose start time is closest to target_date (first run folder by name on a tie).
+
+        Outputs:
+        - index row (pandas Series), its path is None when the run folder has no shapefile
+        """
+        runs = self.query(fire_number=fire_number, vendor='firecast', season=season, include_missing=True)
+        runs = runs[runs['start_time'].notna()]
+        if runs.empty:
+            raise ValueError(f"No FireCast simulations indexed for fire {fire_number}.")
+        date_diff = (runs['start_time'] - pd.Timestamp(target_date)).abs()
+        return runs.loc[date_diff.idxmin()]
+
+    def _refresh_firecast(self, old):
+        frames = []
+        scanned = 0
+        for fire_folder in sorted(os.listdir(self.firecast_root)):
+            match = fire_folder_pattern.match(fire_folder)
+            fire_path = os.path.join(self.firecast_root, fire_folder)
+            if not match or not os.path.isdir(fire_path):
+                continue
+            fire_mtime = mtime(fire_path)
+            fire_rows = old[old['parent'] == fire_path]
+            if not fire_rows.empty and (fire_rows['parent_mtime'] == fire_mtime).all():
+                # no run folders added or removed, only look again at run folders that changed
+                run_folders = fire_rows['folder'].tolist()
+            else:
+                run_folders = [os.path.join(fire_path, name) for name in sorted(os.listdir(fire_path))
+                               if os.path.isdir(os.path.join(fire_path, name))]
+            for run_folder in run_folders:
+                run_mtime = mtime(run_folder)
+                run_rows = fire_rows[fire_rows['folder'] == run_folder]
+                if not run_rows.empty and (run_rows['folder_mtime'] == run_mtime).all():
+                    frames.append(run_rows.assign(parent_mtime=fire_mtime))
+                    continue
+                row = self._scan_firecast_run(int(match.group(1)), match.group(2), run_folder, fire_path, fire_mtime)
+                scanned += 1
+                if row is not None:
+                    frames.append(pd.DataFrame([row], columns=index_columns))
+        frames = [frame for frame in frames if not frame.empty]
+        return (pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=index_columns)), scanned
+
+    def _scan_firecast_run(self, season, fire_number, run_folder, fire_path, fire_mtime):
+        # one run folder as an index row, path is None when there's no shapefile in it (yet)
+        match = run_time_pattern.search(os.path.basename(run_folder))
+        if not match:
+            return None
+        start_time = datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+        row = dict.fromkeys(index_columns)
+        row.update(vendor='firecast', season=season, fire_number=fire_number, sim_id=os.path.basename(run_folder),
+                   start_time=start_time, folder=run_folder, folder_mtime=mtime(run_folder),
+                   parent=fire_path, parent_mtime=fire_mtime)
+        for file_name in os.listdir(run_folder):
+            if file_name.endswith(".shp"):
+                end = output_time_pattern.search(file_name)
+                if end:
+                    row['end_time'] = datetime.strptime(end.group(1), "%Y%m%d%H%M%S")
+                    row['duration_hours'] = (row['end_time'] - start_time).total_seconds() / 3600
+                row['path'] = os.path.join(run_folder, file_name)
+                row['crs'], row['minx'], row['miny'], row['maxx'], row['maxy'] = file_extent(row['path'])
+                break
+        return row
+
+    def _refresh_technosylva(self, old):
+        table_mtime = mtime(self.lookup_table_path)
+        if not old.empty and (old['parent_mtime'] == table_mtime).all():
+            lookup = old.rename(columns={'fire_number': 'NUMBER', 'sim_id': 'Sim_unique',
+                                         'start_time': 'FORECAST_TIMESTAMP', 'duration_hours': 'DURATION_HOURS'})
+        else:
+            lookup = pd.read_excel(self.lookup_table_path, engine='openpyxl')
+
+        rows = []
+        scanned = 0
+        for record in lookup[['NUMBER', 'Sim_unique', 'FORECAST_TIMESTAMP', 'DURATION_HOURS']].itertuples(index=False):
+            folder = os.path.join(self.technosylva_root, str(record.Sim_unique))
+            folder_mtime = mtime(folder)
+            previous = old[old['folder'] == folder]
+            if not previous.empty and previous['folder_mtime'].iloc[0] == folder_mtime:
+                row = previous.iloc[0].to_dict()
+                row.update(fire_number=str(record.NUMBER), start_time=record.FORECAST_TIMESTAMP,
+                           season=pd.Timestamp(record.FORECAST_TIMESTAMP).year,
+                           duration_hours=record.DURATION_HOURS, parent_mtime=table_mtime)
+            else:
+                scanned += 1
+                start_time = pd.Timestamp(record.FORECAST_TIMESTAMP)
+                row = dict.fromkeys(index_columns)
+                row.update(vendor='technosylva', season=start_time.year, fire_number=str(record.NUMBER), sim_id=str(record.Sim_unique),
+                           start_time=start_time, duration_hours=record.DURATION_HOURS,
+                           folder=folder, folder_mtime=folder_mtime,
+                           parent=self.lookup_table_path, parent_mtime=table_mtime)
+                path = os.path.join(folder, "Perimeters.geojson")
+                if os.path.exists(path):
+                    row['path'] = path
+                    row['crs'], row['minx'], row['miny'], row['maxx'], row['maxy'] = file_extent(path)
+            if pd.notna(row['start_time']) and pd.notna(row['duration_hours']):
+                row['end_time'] = pd.Timestamp(row['start_time']) + pd.Timedelta(hours=float(row['duration_hours']))
+            rows.append(row)
+        return pd.DataFrame(rows, columns=index_columns), scanned
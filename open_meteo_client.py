@@ -0,0 +1,314 @@
+'''
+Open-Meteo weather client shared by 10_day_indices_v3.2 and appending_wx_files_meteo_API.py
+
+- sends many latitude/longitude pairs in one request (open-meteo takes comma separated lists)
+- reuses pooled connections through one requests.Session
+- can fetch several models at once (fetch_models), with a concurrency limit, timeouts and retries
+- can fetch every member of an ensemble model from the ensemble API (fetch_ensemble), members come back as
+  <variable>_memberNN next to the control run, ensemble_members() stacks them into one array
+- requests, bytes, latency and cache hits are counted towards the open instrumentation stage (instrumentation.py)
+- caches every location's response on disk, keyed by (model, lat, lon, model run, variables, dates).
+  a cached response is only used while its model run is still the newest one, so re-running a forecast
+  inside the same model cycle doesn't go back to the network at all.
+
+base_url can point at any server that answers like open-meteo (e.g. the local stand-in in tests/test_open_meteo_client.py).
+
+Sample use:
+    client = OpenMeteoClient()
+    data = client.fetch_hourly("gem_seamless", [(48.43, -123.37), (50.67, -120.33)],
+                               hourly=["temperature_2m"], start_date="2025-07-01", end_date="2025-07-10")
+    data[0]["hourly"]["temperature_2m"]
+
+    ens = client.fetch_ensemble("gfs_seamless", [(50.67, -120.33)], hourly=["temperature_2m"], forecast_days=10)
+    ensemble_members(ens[0], "temperature_2m")  # members x hours
+'''
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+ENSEMBLE_URL = "https://ensemble-api.open-meteo.com/v1/ensemble"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "open_meteo")
+
+# (hours between model runs, hours after the run before open-meteo has it)
+# used to work out which run a cached response came from. approximate, check open-meteo docs per model
+MODEL_UPDATE_CYCLES = {
+    "best_match": (1, 1),
+    "ecmwf_ifs025": (6, 7),
+    "gfs_seamless": (6, 5),
+    "gem_seamless": (12, 6),
+    "gem_hrdps_continental": (6, 5),
+    "knmi_seamless": (1, 2),
+    "dmi_seamless": (3, 4)
+}
+DEFAULT_UPDATE_CYCLE = (1, 0)
+
+
+def ensemble_members(response, variable):
+    """
+    Every member of one hourly variable from an ensemble response as one array.
+
+    Inputs:
+    - response: one location's response dict from fetch_ensemble
+    - variable: hourly variable name (e.g. 'temperature_2m')
+
+    Outputs:
+    - float array members x hours, the control run first then member01, member02, ... (missing values are NaN)
+    """
+    hourly = response.get("hourly", {})
+    prefix = variable + "_member"
+    members = sorted((k for k in hourly if k.startswith(prefix) and k[len(prefix):].isdigit()),
+                     key=lambda k: int(k[len(prefix):]))
+    names = ([variable] if variable in hourly else []) + members
+    if not names:
+        raise KeyError(f"No '{variable}' members in the ensemble response.")
+    return np.array([hourly[name] for name in names], dtype=float)
+
+
+def latest_model_run(model, now=None):
+    """
+    Most recent run of a model that should be available on open-meteo.
+
+    Inputs:
+    - model: open-meteo model name (e.g. 'gem_seamless')
+    - now: datetime to evaluate at (UTC), defaults to the current time
+
+    Outputs:
+    - datetime (UTC) of the model run
+    """
+    interval, delay = MODEL_UPDATE_CYCLES.get(model, DEFAULT_UPDATE_CYCLE)
+    now = now or datetime.now(timezone.utc)
+    available = now - timedelta(hours=delay)
+    return available.replace(hour=available.hour - available.hour % interval,
+                             minute=0, second=0, microsecond=0)
+
+
+class OpenMeteoClient:
+    """
+    Batched, cached client for the open-meteo forecast API.
+
+    Parameters:
+    - base_url: forecast endpoint
+    - ensemble_url: ensemble endpoint, used by fetch_ensemble
+    - cache_dir: folder for the on-disk cache, None turns caching off
+    - max_locations: most coordinates sent in a single request
+    - pool_size: connections kept open per host
+    - timeout: seconds before a request is abandoned
+    """
+
+    def __init__(self, base_url=FORECAST_URL, cache_dir=DEFAULT_CACHE_DIR,
+                 max_locations=50, pool_size=10, timeout=60, ensemble_url=ENSEMBLE_URL):
+        self.base_url = base_url
+        self.ensemble_url = ensemble_url
+        self.cache_dir = cache_dir
+        self.max_locations = max_locations
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests_made = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # fetch_models sends requests from worker threads, counters are only updated under this lock
+        self._lock = threading.Lock()
+
+    def fetch_hourly(self, model, coordinates, hourly, **params):
+        """
+        Hourly forecast for a list of coordinates from one model.
+
+        Inputs:
+        - model: open-meteo model name
+        - coordinates: list of (lat, lon) pairs, strings or numbers
+        - hourly: list of hourly variable names
+        - params: anything else open-meteo takes (start_date, end_date, forecast_days, timezone, ...)
+
+        Outputs:
+        - list of open-meteo response dicts, one per coordinate in the same order
+        """
+        run, keys, results, batches = self._plan(model, coordinates, hourly, params)
+        for batch in batches:
+            responses = self._request(model, [coordinates[i] for i in batch], hourly, params)
+            self._fill(model, run, keys, results, batch, responses)
+        return results
+
+    def fetch_ensemble(self, model, coordinates, hourly, **params):
+        """
+        Hourly forecast of every ensemble member for a list of coordinates, from the ensemble API.
+        Same batching and caching as fetch_hourly (cached under <model>_ensemble).
+
+        Inputs:
+        - model: open-meteo ensemble model name (e.g. 'gfs_seamless', 'ecmwf_ifs025', 'gem_global')
+        - coordinates, hourly, params: as in fetch_hourly
+
+        Outputs:
+        - list of open-meteo response dicts, one per coordinate, see ensemble_members()
+        """
+        cache_model = model + "_ensemble"
+        run, keys, results, batches = self._plan(model, coordinates, hourly, params, cache_model)
+        for batch in batches:
+            responses = self._request(model, [coordinates[i] for i in batch], hourly, params, self.ensemble_url)
+            self._fill(cache_model, run, keys, results, batch, responses)
+        return results
+
+    def fetch_models(self, model_requests, hourly, concurrency=4, retries=3, backoff=1.0):
+        """
+        Fetch several models (each for a list of coordinates) at the same time.
+
+        Every request that isn't already cached is sent concurrently, at most `concurrency` at once
+        (a slot is held until the request's thread returns, timed out or not, so the limit holds under slow responses).
+        A request that fails (timeout, connection error, 429 or 5xx) is retried up to `retries` times,
+        waiting backoff, 2*backoff, 4*backoff... seconds in between. Results come back in the same
+        order as model_requests no matter which model answered first, so they can be chained in priority order.
+
+        Inputs:
+        - model_requests: list of (model, coordinates, params) tuples, params as in fetch_hourly
+        - hourly: list of hourly variable names
+        - concurrency: most requests in flight at once (keep <= the client's pool_size)
+        - retries: extra attempts per request
+        - backoff: seconds before the first retry
+
+        Outputs:
+        - list with one entry per model request: the list of responses (as from fetch_hourly),
+          or the exception if that model could not be fetched
+        """
+        return asyncio.run(self.fetch_models_async(model_requests, hourly, concurrency, retries, backoff))
+
+    async def fetch_models_async(self, model_requests, hourly, concurrency=4, retries=3, backoff=1.0):
+        # same as fetch_models, for callers already inside an event loop (e.g. jupyter): await it directly
+        semaphore = asyncio.Semaphore(concurrency)
+        plans = []
+        tasks = []
+        for n, (model, coordinates, params) in enumerate(model_requests):
+            plan = self._plan(model, coordinates, hourly, params)
+            plans.append(plan)
+            for batch in plan[3]:
+                tasks.append((n, batch, self._request_async(
+                    semaphore, model, [coordinates[i] for i in batch], hourly, params, retries, backoff)))
+
+        outcomes = await asyncio.gather(*(task for _, _, task in tasks), return_exceptions=True)
+
+        results = [plan[2] for plan in plans]
+        for (n, batch, _), responses in zip(tasks, outcomes):
+            if isinstance(results[n], Exception):
+                continue
+            if isinstance(responses, Exception):
+                results[n] = responses
+                continue
+            model = model_requests[n][0]
+            run, keys = plans[n][0], plans[n][1]
+            try:
+                self._fill(model, run, keys, results[n], batch, responses)
+            except ValueError as e:
+                results[n] = e
+        return results
+
+    async def _request_async(self, semaphore, model, coordinates, hourly, params, retries, backoff):
+        for attempt in range(retries + 1):
+            try:
+                # no asyncio timeout on top: it can't stop the thread, which would keep its connection busy while
+                # the slot went to the next request. the requests timeout (self.timeout) ends a stalled call
+                async with semaphore:
+                    return await asyncio.to_thread(self._request, model, coordinates, hourly, params)
+            except requests.RequestException as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                # bad requests won't get better by asking again
+                if attempt == retries or (status is not None and status < 500 and status != 429):
+                    raise
+                await asyncio.sleep(backoff * 2**attempt)
+
+    def _plan(self, model, coordinates, hourly, params, cache_model=None):
+        # what's already cached, and the batches of coordinates that still need a request.
+        # cache_model is the cache folder name when it isn't just the model (ensembles)
+        cache_model = cache_model or model
+        run = latest_model_run(model)
+        keys = [self._cache_key(cache_model, lat, lon, run, hourly, params) for lat, lon in coordinates]
+        results = [self._cache_read(cache_model, run, key) for key in keys]
+        missing = [i for i, res in enumerate(results) if res is None]
+        with self._lock:
+            self.cache_hits += len(coordinates) - len(missing)
+            self.cache_misses += len(missing)
+        instrumentation.count(cache_hits=len(coordinates) - len(missing), cache_misses=len(missing))
+        batches = [missing[i:i + self.max_locations] for i in range(0, len(missing), self.max_locations)]
+        return run, keys, results, batches
+
+    def _fill(self, model, run, keys, results, batch, responses):
+        # responses come back in the order the coordinates were sent, a short list can't be matched up
+        if len(responses) != len(batch):
+            raise ValueError(f"open-meteo returned {len(responses)} location(s) for a request of {len(batch)} "
+                             f"({model}).")
+        for i, res in zip(batch, responses):
+            results[i] = res
+            self._cache_write(model, run, keys[i], res)
+
+    def _request(self, model, coordinates, hourly, params, url=None):
+        query = dict(params)
+        query.update({
+            "latitude": ",".join(str(lat) for lat, _ in coordinates),
+            "longitude": ",".join(str(lon) for _, lon in coordinates),
+            "hourly": ",".join(hourly),
+            "models": model
+        })
+        started = time.perf_counter()
+        r = self.session.get(url or self.base_url, params=query, timeout=self.timeout)
+        with self._lock:
+            self.requests_made += 1
+        instrumentation.count(http_requests=1, http_bytes=len(r.content), http_seconds=time.perf_counter() - started)
+        r.raise_for_status()
+        data = r.json()
+        # a single location comes back as one object, several as a list
+        return data if isinstance(data, list) else [data]
+
+    def _cache_key(self, model, lat, lon, run, hourly, params):
+        key = json.dumps({
+            "model": model,
+            "lat": round(float(lat), 4),
+            "lon": round(float(lon), 4),
+            "run": run.isoformat(),
+            "hourly": sorted(hourly),
+            "params": {k: str(v) for k, v in sorted(params.items())}
+        }, sort_keys=True)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _run_folder(self, model, run):
+        return os.path.join(self.cache_dir, model, run.strftime("%Y%m%d%H"))
+
+    def _cache_read(self, model, run, key):
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self._run_folder(model, run), key + ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _cache_write(self, model, run, key, data):
+        if self.cache_dir is None:
+            return
+        folder = self._run_folder(model, run)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+            self._prune(model, run)
+        with open(os.path.join(folder, key + ".json"), "w") as f:
+            json.dump(data, f)
+
+    def _prune(self, model, run):
+        # a new run is out, everything cached from older runs is stale
+        model_folder = os.path.join(self.cache_dir, model)
+        current = run.strftime("%Y%m%d%H")
+        for name in os.listdir(model_folder):
+            if name < current:
+                shutil.rmtree(os.path.join(model_folder, name), ignore_errors=True)
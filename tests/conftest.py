@@ -0,0 +1,29 @@
+'''
+Shared setup for the tests: the repo root and model_comparison/py go on the import path, and the 10 day
+forecaster (a script without a .py extension) is loaded as a module by the ten_day fixture.
+
+Run from the repo root:
+>>python3 -m pytest tests
+'''
+
+import os
+import sys
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+
+import pytest
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_ROOT, os.path.join(REPO_ROOT, "model_comparison", "py")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(scope="session")
+def ten_day():
+    loader = SourceFileLoader("ten_day_indices", os.path.join(REPO_ROOT, "10_day_indices_v3.2"))
+    module = module_from_spec(spec_from_loader(loader.name, loader))
+    sys.modules[loader.name] = module
+    loader.exec_module(module)
+    return module
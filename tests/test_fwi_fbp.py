@@ -0,0 +1,207 @@
+'''
+The array FWI/FBP engine in the 10 day forecaster against the original scalar functions, the FBP lookup
+cube's error bound, and the FWI state checkpoint (update_fwi_state / backfill_fwi_season).
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+N_POINTS = 2000
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(42)
+
+
+def random_weather(rng, n):
+    # includes heavy rain, frost and dead calm so every branch of the FFMC/DMC/DC equations is hit.
+    # rain is either none or over 3 mm: just above the 1.5 mm DMC threshold the scalar dmc() takes the log
+    # of a negative number and raises (the array version gives NaN there)
+    return {"temp": rng.uniform(-5, 35, n), "rh": rng.uniform(5, 100, n), "wind": rng.uniform(0, 50, n),
+            "rain": np.where(rng.random(n) < 0.4, 3.0 + rng.gamma(1.0, 6.0, n), 0.0)}
+
+
+def test_daily_fwi_array_matches_scalar(ten_day, rng):
+    ffmc_old, dmc_old, dc_old = rng.uniform(30, 99, N_POINTS), rng.uniform(0, 150, N_POINTS), rng.uniform(0, 800, N_POINTS)
+    wx = random_weather(rng, N_POINTS)
+    day_of_year = 200
+    arrays = ten_day.compute_daily_fwi_array(ffmc_old, dmc_old, dc_old, wx["temp"], wx["rh"], wx["wind"], wx["rain"],
+                                             day_of_year)
+    scalars = np.array([ten_day.compute_daily_fwi(ffmc_old[n], dmc_old[n], dc_old[n], wx["temp"][n], wx["rh"][n],
+                                                  wx["wind"][n], wx["rain"][n], day_of_year) for n in range(N_POINTS)])
+    for name, values, expected in zip(("FFMC", "DMC", "DC", "ISI", "BUI", "FWI"), arrays, scalars.T):
+        np.testing.assert_allclose(values, expected, rtol=1e-9, atol=1e-9, err_msg=name)
+
+
+@pytest.mark.parametrize("day_of_year", [15, 120, 250, 360])
+def test_daily_fwi_array_matches_scalar_every_season(ten_day, rng, day_of_year):
+    wx = random_weather(rng, 200)
+    start = (np.full(200, 85.0), np.full(200, 20.0), np.full(200, 200.0))
+    arrays = ten_day.compute_daily_fwi_array(*start, wx["temp"], wx["rh"], wx["wind"], wx["rain"], day_of_year)
+    scalars = np.array([ten_day.compute_daily_fwi(85.0, 20.0, 200.0, wx["temp"][n], wx["rh"][n], wx["wind"][n],
+                                                  wx["rain"][n], day_of_year) for n in range(200)])
+    np.testing.assert_allclose(np.array(arrays), scalars.T, rtol=1e-9, atol=1e-9)
+
+
+def test_full_fbp_array_matches_scalar(ten_day, rng):
+    # every fuel in the table plus an unknown code (scalar fallback, id -1)
+    codes = rng.choice(list(ten_day.FUEL_TYPES) + ["XX"], N_POINTS)
+    ffmc, isi, bui = rng.uniform(60, 98, N_POINTS), rng.gamma(2.0, 5.0, N_POINTS), rng.uniform(0, 250, N_POINTS)
+    slope, lat, elev = rng.uniform(0, 80, N_POINTS), rng.uniform(48, 60, N_POINTS), rng.uniform(0, 2000, N_POINTS)
+    ros, hfi = ten_day.compute_full_fbp_array(ten_day.fuel_ids(codes), ffmc, isi, bui, 10.0, slope, lat, elev, 200)
+    expected = np.array([ten_day.compute_full_fbp(codes[n], ffmc[n], isi[n], bui[n], 10.0, slope[n], lat[n],
+                                                  elev[n], 200) for n in range(N_POINTS)])
+    np.testing.assert_allclose(ros, expected[:, 0], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(hfi, expected[:, 1], rtol=1e-9, atol=1e-9)
+
+
+def test_fuel_ids(ten_day):
+    ids = ten_day.fuel_ids([["C2", "c2"], ["O1A", "nope"]])
+    assert ids.tolist() == [[ten_day.FUEL_IDS["C2"]] * 2, [ten_day.FUEL_IDS["O1A"], -1]]
+
+
+@pytest.fixture(scope="module")
+def cube(ten_day):
+    # coarse axes keep the build quick, and leave plenty of cells that have to be flagged
+    return ten_day.FBPCube.build(axes={"isi": (0.0, 1.0, 41), "bui": (0.0, 8.0, 26), "slope": (0.0, 25.0, 3)})
+
+
+def test_fbp_cube_error_bound(ten_day, cube):
+    # every point of the half step grid the build checked, for every fuel: the cube's answer (interpolated
+    # or handed to the exact code) is within the tolerance of the exact FBP at that point
+    rtol, (atol_ros, atol_hfi) = cube.meta["rtol"], cube.meta["atol"]
+    fine = [first + step / 2 * np.arange(2 * count - 1) for first, step, count in cube.axes]
+    isi, bui, slope = (v.ravel() for v in np.meshgrid(*fine, indexing="ij"))
+    for fid, ft in enumerate(ten_day.FUEL_TYPES):
+        fuel = np.full(isi.shape, fid)
+        ros, hfi = cube.query(fuel, 85.0, isi, bui, 0.0, slope, 0.0, 0.0, 180)
+        true_ros, true_hfi = ten_day.compute_full_fbp_array(fuel, 85.0, isi, bui, 0.0, slope, 0.0, 0.0, 180)
+        # the bound is relative to the smallest value in the cell, which is never more than the point's own
+        assert np.all(np.abs(ros - true_ros) <= atol_ros + rtol * np.abs(true_ros) + 1e-4), ft
+        assert np.all(np.abs(hfi - true_hfi) <= atol_hfi + rtol * np.abs(true_hfi) + 1e-2), ft
+
+
+def test_fbp_cube_random_queries(ten_day, cube, rng):
+    # off grid points, unknown fuels, C7 and other foliar moistures all fall back to the exact code
+    n = N_POINTS
+    fuel = ten_day.fuel_ids(rng.choice(list(ten_day.FUEL_TYPES) + ["XX"], n))
+    ffmc, isi, bui, slope = rng.uniform(75, 96, n), rng.uniform(0, 50, n), rng.uniform(0, 250, n), rng.uniform(0, 60, n)
+    lat = np.where(rng.random(n) < 0.8, 0.0, 55.0)
+    ros, hfi = cube.query(fuel, ffmc, isi, bui, 10.0, slope, lat, 0.0, 180)
+    true_ros, true_hfi = ten_day.compute_full_fbp_array(fuel, ffmc, isi, bui, 10.0, slope, lat, 0.0, 180)
+    rtol, (atol_ros, atol_hfi) = cube.meta["rtol"], cube.meta["atol"]
+    assert np.all(np.abs(ros - true_ros) <= atol_ros + rtol * np.abs(true_ros) + 1e-4)
+    assert np.all(np.abs(hfi - true_hfi) <= atol_hfi + rtol * np.abs(true_hfi) + 1e-2)
+
+
+def test_fbp_cube_save_load(ten_day, cube, tmp_path):
+    cube.save(str(tmp_path / "cube"))
+    loaded = ten_day.FBPCube.load(str(tmp_path / "cube"))
+    np.testing.assert_array_equal(loaded.values, cube.values)
+    np.testing.assert_array_equal(loaded.exact, cube.exact)
+
+
+def weather_rows(ids, dates, temp=20.0, rh=40.0, wind=10.0, precip=0.0):
+    return pd.DataFrame([{"ID": i, "Date": d, "Temperature": temp, "RH": rh, "Wind": wind, "Precip": precip}
+                         for d in dates for i in ids])
+
+
+def test_update_fwi_state_steps_one_day(ten_day, tmp_path):
+    state_path = str(tmp_path / "state.npz")
+    first = ten_day.update_fwi_state(weather_rows(["A", "B"], ["2025-07-01"]), state_path)
+    second = ten_day.update_fwi_state(weather_rows(["A", "B"], ["2025-07-02"]), state_path)
+    # matches stepping the scalar code from the start-up codes
+    codes = (85.0, 6.0, 15.0)
+    for day in (182, 183):
+        codes = ten_day.compute_daily_fwi(*codes[:3], 20.0, 40.0, 10.0, 0.0, day)
+    np.testing.assert_allclose(second[["FFMC", "DMC", "DC", "ISI", "BUI", "FWI"]].to_numpy(), [codes, codes])
+    state = ten_day.fwi_state_frame(state_path)
+    assert state["STATION"].tolist() == ["A", "B"]
+    assert (state["DATE"] == pd.Timestamp("2025-07-02")).all()
+    assert len(first) == 2
+
+
+def test_update_fwi_state_rerun_is_a_no_op(ten_day, tmp_path):
+    state_path = str(tmp_path / "state.npz")
+    weather = weather_rows(["A"], ["2025-07-01"])
+    ten_day.update_fwi_state(weather, state_path)
+    before = ten_day.load_fwi_state(state_path)
+    assert ten_day.update_fwi_state(weather, state_path).empty
+    after = ten_day.load_fwi_state(state_path)
+    for key in before:
+        np.testing.assert_array_equal(before[key], after[key])
+
+
+def test_update_fwi_state_gap_raises(ten_day, tmp_path):
+    state_path = str(tmp_path / "state.npz")
+    ten_day.update_fwi_state(weather_rows(["A", "B"], ["2025-07-01"]), state_path)
+    with pytest.raises(ValueError, match="skips day"):
+        ten_day.update_fwi_state(weather_rows(["B"], ["2025-07-03"]), state_path)
+    # nothing was written
+    assert (ten_day.fwi_state_frame(state_path)["DATE"] == pd.Timestamp("2025-07-01")).all()
+
+
+def test_update_fwi_state_duplicates_raise(ten_day, tmp_path):
+    weather = weather_rows(["A"], ["2025-07-01", "2025-07-01"])
+    with pytest.raises(ValueError, match="more than one row"):
+        ten_day.update_fwi_state(weather, str(tmp_path / "state.npz"))
+
+
+def test_update_fwi_state_missing_weather_is_not_stepped(ten_day, tmp_path):
+    state_path = str(tmp_path / "state.npz")
+    ten_day.update_fwi_state(weather_rows(["A", "B"], ["2025-07-01"]), state_path)
+    before = ten_day.fwi_state_frame(state_path)
+
+    weather = weather_rows(["A", "B"], ["2025-07-02"])
+    weather.loc[weather["ID"] == "B", "RH"] = np.nan
+    result = ten_day.update_fwi_state(weather, state_path)
+    assert result.loc[result["ID"] == "B", ["FFMC", "DMC", "DC", "ISI", "BUI", "FWI"]].isna().all(axis=None)
+    assert result.loc[result["ID"] == "A", "FFMC"].notna().all()
+
+    # B keeps its codes and date: the day after is a gap, a late obs for the missed day isn't
+    after = ten_day.fwi_state_frame(state_path).set_index("STATION")
+    assert after.loc["B", "DATE"] == pd.Timestamp("2025-07-01")
+    assert after.loc["B", "FFMC"] == before.set_index("STATION").loc["B", "FFMC"]
+    assert after.loc["A", "DATE"] == pd.Timestamp("2025-07-02")
+    with pytest.raises(ValueError, match="skips day"):
+        ten_day.update_fwi_state(weather_rows(["B"], ["2025-07-03"]), state_path)
+    ten_day.update_fwi_state(weather_rows(["B"], ["2025-07-02"]), state_path)
+    assert (ten_day.fwi_state_frame(state_path)["DATE"] == pd.Timestamp("2025-07-02")).all()
+
+
+def test_backfill_then_update_matches_update_every_day(ten_day, tmp_path, rng):
+    dates = pd.date_range("2025-06-01", periods=20).strftime("%Y-%m-%d")
+    weather = weather_rows(["A", "B", "C"], dates)
+    weather[["Temperature", "RH", "Wind"]] = rng.uniform([5, 20, 0], [30, 90, 30], (len(weather), 3))
+    weather["Precip"] = np.where(rng.random(len(weather)) < 0.3, 3.0 + rng.gamma(1.0, 5.0, len(weather)), 0.0)
+    # C never has an observation
+    weather.loc[weather["ID"] == "C", "Temperature"] = np.nan
+
+    season = ten_day.backfill_fwi_season(weather[weather["Date"] < dates[-1]], str(tmp_path / "backfill.npz"))
+    ten_day.update_fwi_state(weather[weather["Date"] == dates[-1]], str(tmp_path / "backfill.npz"))
+
+    daily_path = str(tmp_path / "daily.npz")
+    daily = [ten_day.update_fwi_state(weather[weather["Date"] == d], daily_path) for d in dates]
+    daily = pd.concat(daily, ignore_index=True).dropna(subset=["FFMC"])
+
+    merged = season.merge(daily, on=["ID", "Date"], suffixes=("_backfill", "_daily"))
+    assert len(merged) == len(season) == 2 * 19
+    for name in ("FFMC", "DMC", "DC", "ISI", "BUI", "FWI"):
+        np.testing.assert_allclose(merged[f"{name}_backfill"], merged[f"{name}_daily"], rtol=1e-12)
+    backfilled = ten_day.fwi_state_frame(str(tmp_path / "backfill.npz"))
+    stepped = ten_day.fwi_state_frame(daily_path)
+    assert backfilled["STATION"].tolist() == ["A", "B", "C"]
+    np.testing.assert_allclose(backfilled[["FFMC", "DMC", "DC"]].to_numpy()[:2],
+                               stepped[["FFMC", "DMC", "DC"]].to_numpy()[:2], rtol=1e-12)
+
+
+def test_backfill_leaves_never_observed_out(ten_day, tmp_path):
+    weather = weather_rows(["A", "B"], ["2025-07-01", "2025-07-02"])
+    weather.loc[weather["ID"] == "B", "Wind"] = np.nan
+    state_path = str(tmp_path / "state.npz")
+    result = ten_day.backfill_fwi_season(weather, state_path)
+    assert set(result["ID"]) == {"A"}
+    assert ten_day.fwi_state_frame(state_path)["STATION"].tolist() == ["A"]
@@ -0,0 +1,128 @@
+'''
+OpenMeteoClient against a local stand-in for open-meteo (http.server): batching, the disk cache and its
+keying by model run, and a server that answers with the wrong number of locations.
+'''
+
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import open_meteo_client
+from open_meteo_client import OpenMeteoClient
+
+
+COORDINATES = [(48.43, -123.37), (49.1, -118.2), (50.67, -120.33), (53.9, -122.75), (58.8, -122.7)]
+
+
+class StandIn:
+    # open-meteo shaped answers, the hourly value is the location's latitude so results can be matched up.
+    # drop: locations left off the end of every answer for more than one location
+    def __init__(self):
+        self.queries = []
+        self.drop = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                stand_in.queries.append(query)
+                lats = [float(lat) for lat in query["latitude"].split(",")]
+                data = [{"latitude": lat, "hourly": {"temperature_2m": [lat]}} for lat in lats]
+                if len(data) > 1:
+                    data = data[:len(data) - stand_in.drop]
+                body = json.dumps(data if len(data) != 1 else data[0]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/forecast"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.fixture
+def client(stand_in, tmp_path):
+    return OpenMeteoClient(base_url=stand_in.url, cache_dir=str(tmp_path), max_locations=2)
+
+
+def fetch(client):
+    return client.fetch_hourly("gem_seamless", COORDINATES, hourly=["temperature_2m"],
+                               start_date="2025-07-01", end_date="2025-07-10")
+
+
+def test_batches_locations(client, stand_in):
+    results = fetch(client)
+    assert [len(q["latitude"].split(",")) for q in stand_in.queries] == [2, 2, 1]
+    assert all(q["models"] == "gem_seamless" and q["hourly"] == "temperature_2m" for q in stand_in.queries)
+    assert [res["hourly"]["temperature_2m"][0] for res in results] == [lat for lat, _ in COORDINATES]
+
+
+def test_cache_hits_skip_the_network(client, stand_in):
+    first = fetch(client)
+    assert client.cache_misses == len(COORDINATES)
+    second = fetch(client)
+    assert len(stand_in.queries) == 3
+    assert client.cache_hits == len(COORDINATES)
+    assert second == first
+
+
+def test_partial_cache_only_requests_missing(client, stand_in):
+    fetch(client)
+    more = COORDINATES + [(60.0, -130.0)]
+    results = client.fetch_hourly("gem_seamless", more, hourly=["temperature_2m"],
+                                  start_date="2025-07-01", end_date="2025-07-10")
+    assert stand_in.queries[-1]["latitude"] == "60.0"
+    assert results[-1]["hourly"]["temperature_2m"] == [60.0]
+
+
+def test_cache_keyed_by_model_run(client, stand_in, tmp_path, monkeypatch):
+    runs = iter([datetime(2025, 7, 1, 0, tzinfo=timezone.utc), datetime(2025, 7, 1, 12, tzinfo=timezone.utc)])
+    run = next(runs)
+    monkeypatch.setattr(open_meteo_client, "latest_model_run", lambda model, now=None: run)
+    fetch(client)
+    fetch(client)
+    assert len(stand_in.queries) == 3
+
+    # a newer run is out: everything is fetched again and the old run's folder is pruned
+    run = next(runs)
+    fetch(client)
+    assert len(stand_in.queries) == 6
+    assert sorted(p.name for p in (tmp_path / "gem_seamless").iterdir()) == ["2025070112"]
+
+
+def test_other_params_are_separate_cache_entries(client, stand_in):
+    fetch(client)
+    client.fetch_hourly("gem_seamless", COORDINATES, hourly=["temperature_2m"],
+                        start_date="2025-07-02", end_date="2025-07-11")
+    assert len(stand_in.queries) == 6
+
+
+def test_short_response_raises(client, stand_in):
+    stand_in.drop = 1
+    with pytest.raises(ValueError, match="returned 1 location"):
+        fetch(client)
+
+
+def test_short_response_fails_only_that_model(client, stand_in):
+    stand_in.drop = 1
+    results = client.fetch_models([("gem_seamless", COORDINATES[:2], {}), ("gfs_seamless", COORDINATES[:1], {})],
+                                  hourly=["temperature_2m"], retries=0)
+    assert isinstance(results[0], ValueError)
+    assert results[1][0]["hourly"]["temperature_2m"] == [48.43]
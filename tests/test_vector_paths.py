@@ -0,0 +1,155 @@
+'''
+The vectorized model comparison paths against the straightforward versions they replaced: compute_areas
+against the three geopandas overlays, HotspotStore.query against a brute force mask, and tiled confusion
+counts against the full rasters.
+'''
+
+import contextlib
+import io
+from datetime import datetime, timedelta
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+from shapely.ops import unary_union
+
+import compare
+import shape_convert
+from hotspots import HotspotStore, epoch_seconds
+
+
+CRS = "EPSG:3005"
+
+
+def random_fire(rng, n_parts, origin=(1_200_000.0, 600_000.0), spread=5000.0):
+    # overlapping blobs, dissolved into a multipart polygon with holes here and there
+    x0, y0 = origin
+    blobs = [Point(x0 + rng.normal(0, spread), y0 + rng.normal(0, spread)).buffer(rng.uniform(300, 2500), 16)
+             for _ in range(n_parts)]
+    fire = unary_union(blobs)
+    holes = [Point(x0 + rng.normal(0, spread), y0 + rng.normal(0, spread)).buffer(rng.uniform(100, 600), 8)
+             for _ in range(n_parts // 3)]
+    return fire.difference(unary_union(holes))
+
+
+def overlay_areas(observed, predicted):
+    # compute_areas as it was: one overlay per area
+    only_observed = observed.overlay(predicted, how='difference', keep_geom_type=False).geometry.area.sum()
+    only_predicted = predicted.overlay(observed, how='difference', keep_geom_type=False).geometry.area.sum()
+    intersection = predicted.overlay(observed, how='intersection', keep_geom_type=False).geometry.area.sum()
+    return intersection, only_predicted, only_observed
+
+
+def as_frame(geometry):
+    parts = list(geometry.geoms) if hasattr(geometry, "geoms") else [geometry]
+    return gpd.GeoDataFrame({"id": range(len(parts))}, geometry=parts, crs=CRS)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compute_areas_matches_overlay(seed):
+    rng = np.random.default_rng(seed)
+    observed, predicted = as_frame(random_fire(rng, 20)), as_frame(random_fire(rng, 20))
+    np.testing.assert_allclose(compare.compute_areas(observed, predicted), overlay_areas(observed, predicted),
+                               rtol=1e-9, atol=1e-3)
+
+
+@pytest.mark.parametrize("case", ["inside", "disjoint", "same"])
+def test_compute_areas_short_cuts(case):
+    rng = np.random.default_rng(7)
+    fire = random_fire(rng, 10)
+    other = {"inside": fire.buffer(-200), "disjoint": random_fire(rng, 5, origin=(1_400_000.0, 600_000.0)),
+             "same": fire}[case]
+    observed, predicted = as_frame(fire), as_frame(other)
+    np.testing.assert_allclose(compare.compute_areas(observed, predicted), overlay_areas(observed, predicted),
+                               rtol=1e-9, atol=1e-3)
+
+
+@pytest.fixture(scope="module")
+def hotspots():
+    rng = np.random.default_rng(3)
+    n = 20_000
+    # clustered like real detections, plus a few far away ones that stretch the grid
+    x = np.concatenate([rng.normal(1_200_000, 30_000, n), rng.uniform(200_000, 1_900_000, 100)])
+    y = np.concatenate([rng.normal(800_000, 30_000, n), rng.uniform(300_000, 1_700_000, 100)])
+    start = epoch_seconds(datetime(2025, 6, 1))
+    times = start + rng.integers(0, 90 * 86400, len(x))
+    return HotspotStore(x, y, times, cell_size=10000)
+
+
+def brute_force(store, bbox, start, end):
+    keep = np.ones(len(store), dtype=bool)
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        keep &= (store.x >= minx) & (store.x <= maxx) & (store.y >= miny) & (store.y <= maxy)
+    if start is not None:
+        keep &= store.times >= epoch_seconds(start)
+    if end is not None:
+        keep &= store.times <= epoch_seconds(end)
+    return np.nonzero(keep)[0]
+
+
+def test_hotspot_query_matches_brute_force(hotspots):
+    rng = np.random.default_rng(4)
+    for _ in range(200):
+        cx, cy = rng.normal(1_200_000, 40_000), rng.normal(800_000, 40_000)
+        w, h = rng.uniform(0, 60_000, 2)
+        bbox = (cx - w, cy - h, cx + w, cy + h)
+        start = datetime(2025, 6, 1) + timedelta(seconds=int(rng.integers(0, 90 * 86400)))
+        end = start + timedelta(days=int(rng.integers(0, 20)))
+        found = hotspots.query(bbox, start, end)
+        np.testing.assert_array_equal(np.sort(found), brute_force(hotspots, bbox, start, end))
+
+
+@pytest.mark.parametrize("bbox, start, end", [
+    (None, None, None),
+    (None, datetime(2025, 7, 1), None),
+    ((0, 0, 100, 100), None, None),
+    ((-1e7, -1e7, 1e7, 1e7), None, datetime(2025, 6, 15)),
+])
+def test_hotspot_query_edge_cases(hotspots, bbox, start, end):
+    found = hotspots.query(bbox, start, end)
+    np.testing.assert_array_equal(np.sort(found), brute_force(hotspots, bbox, start, end))
+
+
+def test_hotspot_query_points_on_the_edges(hotspots):
+    # a box exactly on a point's coordinates and time still finds it (everything is inclusive)
+    n = 123
+    x, y, t = hotspots.x[n], hotspots.y[n], hotspots.times[n]
+    when = datetime(1970, 1, 1) + timedelta(seconds=int(t))
+    assert n in hotspots.query((x, y, x, y), when, when)
+
+
+def test_hotspot_within(hotspots):
+    area = Point(1_200_000, 800_000).buffer(25_000)
+    found = hotspots.within(area)
+    inside = np.array([area.intersects(Point(x, y)) for x, y in zip(hotspots.x, hotspots.y)])
+    np.testing.assert_array_equal(np.sort(found), np.nonzero(inside)[0])
+
+
+@pytest.fixture
+def shape_files(tmp_path):
+    rng = np.random.default_rng(5)
+    paths = []
+    for name, origin in (("simulated", (1_200_000.0, 600_000.0)), ("observed", (1_201_500.0, 599_000.0))):
+        path = str(tmp_path / f"{name}.shp")
+        as_frame(random_fire(rng, 15, origin=origin, spread=1500.0)).to_file(path)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("pixel_size, tile_size", [(20, 64), (20, 100), (50, 7), (30, 4096)])
+def test_tiled_confusion_matches_full(shape_files, pixel_size, tile_size):
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = shape_convert.confusion(shape_files, pixel_size=pixel_size, plot=False)
+    tiled = shape_convert.confusion(shape_files, pixel_size=pixel_size, tile_size=tile_size)
+    assert (tiled.tt, tiled.tf, tiled.ft, tiled.ff) == (full.tt, full.tf, full.ft, full.ff)
+    assert full.tt > 0 and full.tf > 0 and full.ft > 0 and full.ff > 0
+
+
+def test_confusion_counts_match_rasters(shape_files):
+    data = shape_convert.shapefile_to_raster(shape_files, pixel_size=25, dtype='uint8')
+    metrics = shape_convert.confusion_counts(data[0], data[1])
+    sim, obs = data[0].astype(bool), data[1].astype(bool)
+    assert (metrics.tt, metrics.tf, metrics.ft, metrics.ff) == (
+        np.sum(sim & obs), np.sum(sim & ~obs), np.sum(~sim & obs), np.sum(~sim & ~obs))